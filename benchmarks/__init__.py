@@ -0,0 +1,3 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the offline benchmarks of ZoomDL, see benchmarks/run.py."""
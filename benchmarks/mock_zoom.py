@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define a local HTTP server mimicking Zoom, for offline benchmarks.
+
+It serves synthetic share pages (hidden inputs, `window.__data__`, chat and
+transcript pushes), validates passwords at `/rec/validate_meet_passwd`, and
+serves large range-capable MP4 payloads generated on the fly.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+BLOCK_SIZE = 1024 ** 2
+# payloads are this pseudo-random block repeated, to not hold GBs in memory
+_BLOCK = random.Random(0).getrandbits(8 * BLOCK_SIZE).to_bytes(BLOCK_SIZE,
+                                                               "little")
+PASSWORD_COOKIE = "zoomdl_mock_pass"
+
+
+def payload(start: int, end: int) -> bytes:
+    """Return bytes start to end (included) of any payload."""
+    chunks = []
+    while start <= end:
+        offset = start % BLOCK_SIZE
+        chunk = _BLOCK[offset:min(BLOCK_SIZE, offset + end - start + 1)]
+        chunks.append(chunk)
+        start += len(chunk)
+    return b"".join(chunks)
+
+
+def payload_sha256(size: int) -> str:
+    """Return the SHA-256 digest of a payload of size bytes."""
+    digest = hashlib.sha256()
+    for start in range(0, size, BLOCK_SIZE):
+        digest.update(payload(start, min(size, start + BLOCK_SIZE) - 1))
+    return digest.hexdigest()
+
+
+def make_page(rec_id: str, host: str, chats: int = 100,
+              transcripts: int = 100, extra_keys: int = 100,
+              clip: int = 1, total_clips: int = 1,
+              screen: bool = True) -> str:
+    """Return a synthetic share page, in the layout of Zoom's pages.
+
+    Args:
+        rec_id (str): identifier of the recording, used in its topic
+        host (str): base url of the video links
+        chats (int): count of chat messages
+        transcripts (int): count of transcript lines
+        extra_keys (int): count of filler keys in `window.__data__`
+        clip (int): current clip number, from 1
+        total_clips (int): count of clips of the recording
+        screen (bool): whether there is a shared screen stream
+    """
+    rnd = random.Random(rec_id)
+    data = ["window.__data__ = {",
+            "  topic: 'Recording {}',".format(rec_id),
+            "  fileStartTime: 1600000000000,",
+            "  totalClips: {},".format(total_clips),
+            "  currentClip: {},".format(clip),
+            "  nextClipStartTime: {},".format(
+                clip * 1000 if clip < total_clips else -1),
+            "  viewMp4Url: '{}/rec/{}/{}/camera.mp4?sig=x',".format(
+                host, rec_id, clip)]
+    if screen:
+        data.append("  shareMp4Url: '{}/rec/{}/{}/screen.mp4?sig=x',".format(
+            host, rec_id, clip))
+    data.extend("  filler{}: \"{}\",".format(idx, "x" * rnd.randint(10, 80))
+                for idx in range(extra_keys))
+    data.append("};")
+    lines = ['<html><body>',
+             '<input type="hidden" id="meetId" value="{}">'.format(rec_id),
+             '<input type="hidden" id="r_meeting_topic" value="{}">'
+             .format(rec_id),
+             '<script>']
+    lines.extend(data)
+    for idx in range(chats):
+        lines.extend([
+            "window.__data__.chatList.push({",
+            "  username: 'user{}',".format(idx % 50),
+            "  time: '{:02d}:{:02d}:{:02d}',".format(
+                idx // 3600 % 24, idx // 60 % 60, idx % 60),
+            "  content: \"{}\"".format("message " * rnd.randint(1, 20)),
+            "});"])
+    for idx in range(transcripts):
+        lines.extend([
+            "window.__data__.transcriptList.push({",
+            "  username: \"user{}\",".format(idx % 50),
+            "  ts: \"00:{:02d}:{:02d}.100\",".format(idx // 60 % 60,
+                                                     idx % 60),
+            "  endTs: \"00:{:02d}:{:02d}.900\",".format(idx // 60 % 60,
+                                                        idx % 60),
+            "  text: \"{}\"".format("spoken words " * rnd.randint(1, 20)),
+            "});"])
+    lines.extend(["</script>", "</body></html>"])
+    return "\n".join(lines)
+
+
+class MockZoomServer():
+    """Local server mimicking Zoom share pages and video CDN.
+
+    Recordings are served at `/rec/play/<rec_id>`; a recording whose id
+    starts with "pw" requires the password `password`.
+    """
+
+    def __init__(self, video_size: int = 64 * 1024 ** 2, chats: int = 100,
+                 transcripts: int = 100, total_clips: int = 1):
+        """Init the server, without starting it."""
+        self.video_size = video_size
+        self.page_options = {"chats": chats,
+                             "transcripts": transcripts,
+                             "total_clips": total_clips}
+        self.requests = {"page": 0, "head": 0, "video": 0, "validate": 0}
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    @property
+    def url(self) -> str:
+        """Return the base url of the running server."""
+        return "http://127.0.0.1:{}".format(self._httpd.server_address[1])
+
+    def start(self):
+        """Start serving in a background thread."""
+        server = self
+
+        class Handler(_Handler):
+            mock = server
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, kind: str):
+        """Count one request of the given kind."""
+        with self._lock:
+            self.requests[kind] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None  # set by MockZoomServer.start
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionError, BrokenPipeError):
+            # client closed a connection early, like a stopped download
+            pass
+
+    def _send(self, status: int, body: bytes = b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path)
+        if path.path.endswith(".mp4"):
+            return self._video(head=False)
+        match = re.match(r"/rec/play/([^/&?]+)", path.path)
+        if match is None:
+            return self._send(404)
+        self.mock.count("page")
+        rec_id = match.group(1)
+        start_time = re.search(r"startTime=(\d+)", self.path)
+        clip = 1 + (int(start_time.group(1)) // 1000 if start_time else 0)
+        if (rec_id.startswith("pw") and
+                PASSWORD_COOKIE not in self.headers.get("Cookie", "")):
+            # protected: only the form, no metadata
+            body = ('<html><input type="hidden" id="meetId" value="{}">'
+                    '</html>'.format(rec_id))
+        else:
+            host = "https://ssrweb.zoom.us"
+            body = make_page(rec_id, host, clip=clip, **self.mock.page_options)
+        self._send(200, body.encode(),
+                   {"Content-Type": "text/html; charset=utf-8"})
+
+    def do_HEAD(self):
+        if not urlparse(self.path).path.endswith(".mp4"):
+            return self._send(404)
+        self._video(head=True)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if urlparse(self.path).path != "/rec/validate_meet_passwd":
+            return self._send(404)
+        self.mock.count("validate")
+        if form.get("passwd") == ["password"]:
+            return self._send(200, json.dumps({"status": True}).encode(),
+                              {"Set-Cookie": "{}=1; Path=/".format(
+                                  PASSWORD_COOKIE)})
+        self._send(200, json.dumps({"status": False}).encode())
+
+    def _video(self, head: bool):
+        self.mock.count("head" if head else "video")
+        size = self.mock.video_size
+        start, end = 0, size - 1
+        headers = {"Accept-Ranges": "bytes",
+                   "Content-Type": "video/mp4",
+                   "ETag": '"{}"'.format(size)}
+        status = 200
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match is not None:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(end, int(match.group(2)))
+            if start >= size:
+                return self._send(416, headers={
+                    "Content-Range": "bytes */{}".format(size)})
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end,
+                                                               size)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+        for offset in range(start, end + 1, BLOCK_SIZE):
+            self.wfile.write(payload(offset,
+                                     min(end, offset + BLOCK_SIZE - 1)))
+
+
+class RedirectAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter sending every zoom request to the mock server."""
+
+    def __init__(self, target: str, **kwargs):
+        """Init the adapter, redirecting to target (base url)."""
+        super().__init__(**kwargs)
+        self.target = target
+
+    def send(self, request, **kwargs):
+        """Send the request to the mock server.
+
+        The response looks like it comes from the original url, so that
+        cookies are stored for the zoom domain.
+        """
+        local = request.copy()
+        local.url = re.sub(r"^https?://[^/]*zoom[^/]*\.(?:us|com)",
+                           self.target, request.url)
+        response = super().send(local, **kwargs)
+        response.url = request.url
+        response.request = request
+        return response
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Run the offline benchmarks of ZoomDL against a local mock Zoom server.
+
+Usage, from the root of the repository:
+
+    python -m benchmarks.run [--output results.json] [--compare old.json]
+
+Results are emitted as JSON. With --compare, the exit code is 1 if any
+metric regressed by more than --tolerance compared to a previous run.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from .mock_zoom import MockZoomServer, RedirectAdapter, make_page, \
+    payload_sha256
+
+# (name, chats, transcripts, filler keys of window.__data__)
+PARSE_SCENARIOS = [
+    ("small", 100, 100, 100),
+    ("medium", 2000, 2000, 1000),
+    ("large", 20000, 20000, 5000),
+]
+# (name, zoomdl arguments), "{batch}" is replaced by a batch file of 4 urls
+DOWNLOAD_SCENARIOS = [
+    ("single", ["-u", "https://zoom.us/rec/play/single"]),
+    ("connections-4", ["-u", "https://zoom.us/rec/play/conn4",
+                       "--connections", "4"]),
+    ("password", ["-u", "https://zoom.us/rec/play/pw1",
+                  "-p", "password"]),
+    ("batch-jobs-4", ["-a", "{batch}", "-j", "4"]),
+]
+# seconds a download scenario may take before being killed
+DOWNLOAD_TIMEOUT = 600
+# modules too slow to import before the command line is parsed
+STARTUP_HEAVY_MODULES = ["requests", "urllib3", "demjson3", "tqdm", "asyncio"]
+# metrics compared with --compare, and whether higher is better
+COMPARED_METRICS = {
+    "median_s": False,
+    "throughput_mib_s": True,
+    "cpu_s_per_gib": False,
+    "peak_rss_mib": False,
+}
+
+
+def _cpu_time() -> float:
+    """Return the CPU time (user + system) of this process."""
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mib() -> float:
+    """Return the peak resident memory of this process, in MiB."""
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak / 1024 ** (2 if sys.platform == "darwin" else 1)
+
+
+def _run_python(args: list) -> subprocess.CompletedProcess:
+    """Run a fresh interpreter from the root of the repository."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable] + args, cwd=root,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def bench_startup(repeat: int) -> list:
+    """Measure the import time of zoom_dl and the run time of --help.
+
+    The import is measured with `python -X importtime`, which also tells
+    which modules were imported: none of STARTUP_HEAVY_MODULES should be.
+    """
+    imports = []
+    imported = set()
+    for _ in range(repeat):
+        stderr = _run_python(["-X", "importtime", "-c",
+                              "import zoom_dl"]).stderr
+        for line in stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            fields = line.split("|")
+            if len(fields) != 3 or not line.startswith("import time:"):
+                continue
+            name = fields[2].strip()
+            imported.add(name)
+            if fields[2] == " zoom_dl":
+                imports.append(int(fields[1]) / 1e6)
+    heavy = [name for name in STARTUP_HEAVY_MODULES if name in imported]
+    helps = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_python(["-m", "zoom_dl", "--help"])
+        helps.append(time.perf_counter() - start)
+    return [{"name": "import",
+             "success": not heavy,
+             "heavy_modules": heavy,
+             "median_s": round(statistics.median(imports), 4),
+             "min_s": round(min(imports), 4)},
+            {"name": "help",
+             "median_s": round(statistics.median(helps), 4),
+             "min_s": round(min(helps), 4)}]
+
+
+def bench_parse(repeat: int) -> list:
+    """Measure get_page_meta on synthetic pages of increasing size."""
+    from zoom_dl.utils import parseOpts
+    from zoom_dl.zoomdl import Recording, ZoomDL
+
+    zdl = ZoomDL(parseOpts(["-u", "https://zoom.us/rec/play/x", "-v", "5"]))
+    results = []
+    for name, chats, transcripts, extra_keys in PARSE_SCENARIOS:
+        text = make_page(name, "https://ssrweb.zoom.us", chats=chats,
+                         transcripts=transcripts, extra_keys=extra_keys)
+        rec = Recording("https://zoom.us/rec/play/" + name)
+        rec.page = types.SimpleNamespace(text=text)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            meta = zdl.get_page_meta(rec)
+            timings.append(time.perf_counter() - start)
+        assert len(meta["chatList"]) == chats
+        assert len(meta["transcriptList"]) == transcripts
+        size = len(text.encode())
+        results.append({
+            "name": name,
+            "page_mib": round(size / 1024 ** 2, 3),
+            "chats": chats,
+            "transcripts": transcripts,
+            "median_s": round(statistics.median(timings), 4),
+            "min_s": round(min(timings), 4),
+            "throughput_mib_s": round(size / 1024 ** 2 /
+                                      statistics.median(timings), 2),
+        })
+    return results
+
+
+def bench_export(repeat: int, count: int = 20000) -> list:
+    """Measure the export of count chat messages and transcripts."""
+    from zoom_dl.exporters import FORMATS, write_chat, write_transcript
+
+    messages = [{"username": "user{}".format(idx % 50),
+                 "time": "{:02d}:{:02d}:{:02d}".format(
+                     idx // 3600 % 24, idx // 60 % 60, idx % 60),
+                 "content": "message {}".format(idx)}
+                for idx in range(count)]
+    transcripts = [{"username": "user{}".format(idx % 50),
+                    "ts": "00:{:02d}:{:02d}.100".format(idx // 60 % 60,
+                                                        idx % 60),
+                    "endTs": "00:{:02d}:{:02d}.900".format(idx // 60 % 60,
+                                                           idx % 60),
+                    "text": "spoken words {}".format(idx)}
+                   for idx in range(count)]
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind, write, entries in (("chat", write_chat, messages),
+                                     ("transcript", write_transcript,
+                                      transcripts)):
+            for fmt in FORMATS:
+                path = os.path.join(workdir, "{}.{}".format(kind, fmt))
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    write(entries, path, fmt)
+                    timings.append(time.perf_counter() - start)
+                results.append({"name": "{}-{}".format(kind, fmt),
+                                "entries": count,
+                                "median_s": round(statistics.median(timings),
+                                                  4),
+                                "min_s": round(min(timings), 4)})
+    return results
+
+
+def _download_child(queue, server_url, argv, workdir):
+    """Run one download scenario, in a fresh process."""
+    import zoom_dl
+    from zoom_dl.utils import parseOpts, read_batch_file
+
+    os.chdir(workdir)
+    sys.stderr = open(os.devnull, "w")  # progress bars
+    args = parseOpts(argv + ["-v", "5"])
+    urls = (read_batch_file(args.batch_file) if args.batch_file
+            else [args.url])
+    zdl = zoom_dl.ZoomDL(args)
+    adapter = RedirectAdapter(server_url, pool_maxsize=64)
+    zdl.session.mount("https://", adapter)
+    zdl.session.mount("http://", adapter)
+    cpu_start, wall_start = _cpu_time(), time.perf_counter()
+    success = zdl.download(urls)
+    wall = time.perf_counter() - wall_start
+    cpu = _cpu_time() - cpu_start
+    queue.put({"success": success, "wall_s": wall, "cpu_s": cpu,
+               "peak_rss_mib": _peak_rss_mib()})
+
+
+def _wait_child(child, queue, timeout: float) -> tuple:
+    """Wait for the result of a scenario run in child.
+
+    The child is killed if it takes more than timeout seconds.
+
+    Returns:
+        tuple: the result dict, or None and the reason it is missing
+    """
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None and time.monotonic() < deadline:
+        try:
+            result = queue.get(timeout=1)
+        except queue_module.Empty:
+            if not child.is_alive():
+                # its last put may still be in the pipe
+                try:
+                    result = queue.get(timeout=1)
+                except queue_module.Empty:
+                    break
+    child.join(5)
+    killed = child.is_alive()
+    if killed:
+        child.kill()
+        child.join()
+    if result is not None:
+        return result, None
+    if killed:
+        return None, "killed after {} seconds".format(timeout)
+    return None, "exited with code {}".format(child.exitcode)
+
+
+def bench_download(video_size: int) -> list:
+    """Measure ZoomDL.download on each download scenario."""
+    server = MockZoomServer(video_size=video_size).start()
+    expected = payload_sha256(video_size)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for name, argv in DOWNLOAD_SCENARIOS:
+            with tempfile.TemporaryDirectory() as workdir:
+                batch = os.path.join(workdir, "urls.txt")
+                with open(batch, "w") as f:
+                    f.write("\n".join("https://zoom.us/rec/play/batch{}"
+                                      .format(idx) for idx in range(4)))
+                argv = [arg.replace("{batch}", batch) for arg in argv]
+                before = dict(server.requests)
+                queue = context.Queue()
+                child = context.Process(target=_download_child,
+                                        args=(queue, server.url, argv,
+                                              workdir))
+                child.start()
+                result, error = _wait_child(child, queue, DOWNLOAD_TIMEOUT)
+                videos = glob.glob(os.path.join(workdir, "*.mp4"))
+                size = sum(os.path.getsize(path) for path in videos)
+                valid = all(_sha256(path) == expected for path in videos)
+            if result is None:
+                results.append({"name": name, "success": False,
+                                "error": error, "files": len(videos)})
+                continue
+            gib = size / 1024 ** 3
+            results.append({
+                "name": name,
+                "success": result["success"] and valid and len(videos) > 0,
+                "files": len(videos),
+                "downloaded_mib": round(size / 1024 ** 2, 1),
+                "wall_s": round(result["wall_s"], 3),
+                "throughput_mib_s": round(size / 1024 ** 2 /
+                                          result["wall_s"], 1),
+                "cpu_s": round(result["cpu_s"], 3),
+                "cpu_s_per_gib": round(result["cpu_s"] / gib, 3),
+                "peak_rss_mib": round(result["peak_rss_mib"], 1),
+                "requests": {kind: server.requests[kind] - before[kind]
+                             for kind in server.requests},
+            })
+    finally:
+        server.stop()
+    return results
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compare(results: dict, previous: dict, tolerance: float) -> list:
+    """Return the metrics that regressed by more than tolerance."""
+    regressions = []
+    for section in ("startup", "parse", "export", "download"):
+        old = {bench["name"]: bench for bench in previous.get(section, [])}
+        for bench in results.get(section, []):
+            for metric, higher_better in COMPARED_METRICS.items():
+                if (bench["name"] not in old or metric not in bench or
+                        metric not in old[bench["name"]]):
+                    continue
+                new_value = bench[metric]
+                old_value = old[bench["name"]][metric]
+                if not old_value:
+                    continue
+                change = (new_value - old_value) / old_value
+                if higher_better:
+                    change = -change
+                if change > tolerance:
+                    regressions.append({"section": section,
+                                        "name": bench["name"],
+                                        "metric": metric,
+                                        "old": old_value,
+                                        "new": new_value})
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks and print (or save) the JSON results."""
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of ZoomDL")
+    parser.add_argument("--video-mib", type=int, default=256,
+                        help="Size of each served video, in MiB")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Repetitions of each startup, parse and "
+                        "export benchmark")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--skip-parse", action="store_true")
+    parser.add_argument("--skip-export", action="store_true")
+    parser.add_argument("--skip-download", action="store_true")
+    parser.add_argument("--output", help="File to write the results to")
+    parser.add_argument("--compare",
+                        help="Previous results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Accepted relative regression, default 0.2")
+    args = parser.parse_args(argv)
+
+    from zoom_dl.version import __version__
+    results = {"meta": {"zoomdl_version": __version__,
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S")}}
+    if not args.skip_startup:
+        results["startup"] = bench_startup(args.repeat)
+    if not args.skip_parse:
+        results["parse"] = bench_parse(args.repeat)
+    if not args.skip_export:
+        results["export"] = bench_export(args.repeat)
+    if not args.skip_download:
+        results["download"] = bench_download(args.video_mib * 1024 ** 2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            results["regressions"] = compare(results, json.load(f),
+                                             args.tolerance)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    failed = any(not bench.get("success", True)
+                 for section in ("startup", "download")
+                 for bench in results.get(section, []))
+    if failed or results.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Test the state transitions of the download queue."""
+
+import os
+import socket
+import stat
+import subprocess  # nosec
+import sys
+import tempfile
+import unittest
+
+from zoom_dl.workqueue import MAX_ATTEMPTS, DownloadQueue
+
+URL = "https://us02web.zoom.us/rec/play/abc"
+
+
+class DownloadQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.db")
+        self.queue = DownloadQueue(self.path)
+        self.queue.submit([URL], {"password": "secret"})
+
+    def tearDown(self):
+        self.queue.close()
+        self.directory.cleanup()
+
+    def _set(self, assignments: str, *params):
+        with self.queue._db:
+            self.queue._db.execute("UPDATE jobs SET " + assignments, params)
+
+    def _state(self):
+        return self.queue._db.execute(
+            "SELECT state, attempts, owner FROM jobs").fetchone()
+
+    def test_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_submit_once(self):
+        self.assertEqual(self.queue.submit([URL], {}), 0)
+        self.queue.complete(self.queue.lease())
+        self.assertEqual(self.queue.submit([URL], {}), 1)
+
+    def test_lease(self):
+        job = self.queue.lease()
+        self.assertEqual((job.url, job.options, job.attempts),
+                         (URL, {"password": "secret"}, 1))
+        self.assertEqual(self._state(), ("leased", 1, self.queue.owner))
+        self.assertIsNone(self.queue.lease())
+
+    def test_expired_lease(self):
+        job = self.queue.lease()
+        self.queue.renew([job])
+        self.assertIsNone(self.queue.lease())
+        self._set("lease_expires = 0")
+        self.assertEqual(self.queue.lease().attempts, 2)
+
+    def test_recover_dead_process(self):
+        self.queue.lease()
+        # a pid of this host no longer used
+        child = subprocess.Popen([sys.executable, "-c", ""])  # nosec
+        child.wait()
+        self._set("owner = ?", "{}:{}".format(socket.gethostname(),
+                                              child.pid))
+        self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self._state(), ("queued", 1, None))
+
+    def test_recover_live_process(self):
+        self.queue.lease()
+        self.assertEqual(self.queue.recover(), 0)
+        self.assertEqual(self._state()[0], "leased")
+
+    def test_fail(self):
+        job = self.queue.lease()
+        self.assertTrue(self.queue.fail(job, "error"))
+        self.assertEqual(self._state(), ("queued", 1, None))
+        # not before a while
+        self.assertIsNone(self.queue.lease())
+        self._set("not_before = 0")
+        for _ in range(MAX_ATTEMPTS - 1):
+            job = self.queue.lease()
+            retry = self.queue.fail(job, "error")
+            self._set("not_before = 0")
+        self.assertFalse(retry)
+        self.assertEqual(self._state()[0], "failed")
+        self.assertIsNone(self.queue.lease())
+
+    def test_crashing_job_gives_up(self):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.assertEqual(self.queue.lease().attempts, attempt)
+            self._set("lease_expires = 0")
+        self.assertIsNone(self.queue.lease())
+        self.assertEqual(self._state()[0], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
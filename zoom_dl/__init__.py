@@ -2,10 +2,31 @@
 # coding: utf-8
 """Define the init file, to be called by the main."""
 
-from .zoomdl import ZoomDL
-from .utils import parseOpts
+from .errors import (AuthenticationError, InvalidURLError, MetadataError,
+                     OutputExistsError, PageError, ZoomDLError)
+from .utils import parseOpts, read_batch_file
+import importlib
 import sys
 
+__all__ = ["AsyncZoomDL", "ZoomDL", "ZoomDLError", "AuthenticationError",
+           "DownloadError", "InvalidURLError", "MetadataError",
+           "OutputExistsError", "PageError", "main"]
+
+# imported on first use, so that the command line starts fast (requests,
+# asyncio,... are only imported once the arguments are valid)
+_LAZY_ATTRIBUTES = {"AsyncZoomDL": ".api",
+                    "DownloadError": ".transfer",
+                    "ZoomDL": ".zoomdl"}
+
+
+def __getattr__(name):
+    """Import the lazy attributes of the package."""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module {!r} has no attribute {!r}"
+                             .format(__name__, name))
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    return getattr(module, name)
+
 
 def main():
     """Get parsed options, sanity check them, then call ZoomDL."""
@@ -14,6 +35,47 @@ def main():
     if args.log_level > 5:
         raise ValueError("Log-level value should be between 0 and 5, included")
 
-    all_urls = [args.url]  # prepare for batch reading
+    if args.batch_file is not None:
+        all_urls = read_batch_file(args.batch_file)
+    elif args.url is not None:
+        all_urls = [args.url]
+    else:
+        # --daemon alone
+        all_urls = None
+    if all_urls is not None and len(all_urls) == 0:
+        raise ValueError("No url to download")
+    if (args.filename not in (None, "-") and all_urls is not None and
+            len(all_urls) > 1):
+        raise ValueError("A filename can't be given when downloading "
+                         "several urls")
+    if args.filename == "-" and args.output_pipe is not None:
+        raise ValueError("Videos can't be streamed both to the standard "
+                         "output and to a command")
+    if args.filename == "-" and (all_urls is None or len(all_urls) > 1 or
+                                 args.count_clips != 1 or
+                                 args.queue is not None):
+        # videos written one after the other can't be told apart
+        raise ValueError("Only one video can be streamed to the standard "
+                         "output, use --output-pipe to stream several")
+    if args.metadata_only is not None and args.queue is not None:
+        raise ValueError("An inventory can't be written from a queue")
+    if args.queue is not None:
+        from .workqueue import DownloadQueue, job_options
+        queue = DownloadQueue(args.queue)
+        if all_urls is not None:
+            added = queue.submit(all_urls, job_options(args))
+            if args.log_level <= 1:
+                print("Queued {} of {} urls".format(added, len(all_urls)))
+        if not args.daemon:
+            queue.close()
+            return
+    from .zoomdl import ZoomDL
     zdl = ZoomDL(args)
-    zdl.download(all_urls)
+    if args.daemon:
+        zdl.serve(queue)
+    if args.metadata_only is not None:
+        if not zdl.inventory(all_urls, args.metadata_only):
+            sys.exit(1)
+        return
+    if not zdl.download(all_urls):
+        sys.exit(1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the asynchronous API, to use ZoomDL as a library."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .utils import parseOpts
+from .zoomdl import ZoomDL
+
+
+class AsyncZoomDL():
+    """Fetch and download Zoom recordings from asyncio code.
+
+    Recordings are processed in a pool of threads, by ZoomDL instances
+    sharing a single session (and connection pool), rate limits, caches and
+    stats. Errors are raised as ZoomDLError subclasses.
+
+    Example:
+        async with AsyncZoomDL(jobs=8, connections=4) as zoomdl:
+            metadata = await zoomdl.fetch_metadata(url, password="secret")
+            files = await zoomdl.download(url, "/data/recordings")
+
+    A cancelled call stops waiting, but its download goes on in the
+    background until it is done.
+    """
+
+    def __init__(self, jobs: int = 4, **options):
+        """Init the client.
+
+        Args:
+            jobs (int): count of recordings processed at the same time
+            options: default options of the command line, by their long
+                names (e.g. connections=4, limit_rate=2 * 1024**2,
+                cookies="cookies.txt"). Nothing is printed unless
+                log_level is given.
+        """
+        options.setdefault("log_level", 5)
+        args = parseOpts(["--url", "", "--jobs", str(jobs)])
+        for key, value in options.items():
+            if not hasattr(args, key):
+                raise TypeError("Unknown option: {}".format(key))
+            setattr(args, key, value)
+        self.zoomdl = ZoomDL(args)
+        self._executor = ThreadPoolExecutor(jobs)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def fetch_metadata(self, url: str,
+                             password: Optional[str] = None) -> dict:
+        """Return the metadata of the recording at url.
+
+        Raises:
+            InvalidURLError: if the url is not a zoom url
+            AuthenticationError: if the password is refused
+            PageError: if the page can't be loaded
+            MetadataError: if the metadata can't be found, or is invalid
+        """
+        zoomdl = self.zoomdl.with_options(password=password)
+        return await self._run(zoomdl.fetch_metadata, url)
+
+    async def download(self, url: str, dest: str,
+                       password: Optional[str] = None,
+                       filename: Optional[str] = None,
+                       count_clips: int = 1,
+                       overwrite: bool = False,
+                       **options) -> List[str]:
+        """Download the recording at url in the directory dest.
+
+        Args:
+            url (str): url of the recording
+            dest (str): directory of the downloaded files
+            password (str, optional): password of the recording
+            filename (str, optional): name of the files, without
+                extension. Default to the name given by Zoom.
+            count_clips (int): clips to download, see --count-clips
+            overwrite (bool): erase existing files, instead of raising
+                OutputExistsError
+            options: other options of the command line for this download
+
+        Returns:
+            list: paths of the downloaded files (videos, chat,...)
+
+        Raises:
+            ZoomDLError: if the recording or one of its files can't be
+            downloaded
+        """
+        zoomdl = self.zoomdl.with_options(url=url, output_dir=dest,
+                                          password=password,
+                                          filename=filename,
+                                          count_clips=count_clips,
+                                          **options)
+        zoomdl.overwrite = overwrite
+        await self._run(zoomdl.download_recording, url)
+        return zoomdl.files
+
+    async def close(self):
+        """Wait for the running downloads, and release the resources."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self.zoomdl.session.close()
+        if self.zoomdl.cache is not None:
+            self.zoomdl.cache.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
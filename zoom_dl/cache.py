@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the on-disk cache of recordings metadata."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def default_cache_dir() -> str:
+    """Return the default directory of the cache, following XDG."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return os.path.join(os.path.expanduser(base), "zoomdl")
+
+
+class MetadataCache():
+    """Cache of parsed pages and video headers, stored in SQLite.
+
+    Pages are keyed by the url they were requested with, videos by their
+    (signed) url. Entries older than `ttl` seconds are ignored, because
+    the signed video urls they contain expire.
+    """
+
+    def __init__(self, cache_dir: str, ttl: int):
+        """Open (or create) the cache in cache_dir."""
+        os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "cache.sqlite3"),
+                                   check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS pages ("
+                             "url TEXT PRIMARY KEY, page_url TEXT, "
+                             "metadata TEXT, created REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS heads ("
+                             "url TEXT PRIMARY KEY, headers TEXT, "
+                             "created REAL)")
+            # drop what expired, so the cache doesn't grow forever
+            limit = time.time() - ttl
+            self._db.execute("DELETE FROM pages WHERE created < ?", (limit,))
+            self._db.execute("DELETE FROM heads WHERE created < ?", (limit,))
+
+    def _get(self, table: str, url: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM {} WHERE url = ? AND created >= ?"
+                .format(table), (url, time.time() - self.ttl)).fetchone()
+        return row
+
+    def get_page(self, url: str) -> Optional[dict]:
+        """Return the cached page of url.
+
+        Returns:
+            dict: with keys `page_url` (url after redirections) and
+            `metadata`, or None if not cached or expired.
+        """
+        row = self._get("pages", url)
+        if row is None:
+            return None
+        return {"page_url": row[1], "metadata": json.loads(row[2])}
+
+    def put_page(self, url: str, page_url: str, metadata: dict):
+        """Cache the parsed metadata of the page requested at url."""
+        with self._lock, self._db:
+            self._db.execute("REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                             (url, page_url, json.dumps(metadata),
+                              time.time()))
+
+    def get_head(self, url: str) -> Optional[dict]:
+        """Return the cached headers of the video at url, if any."""
+        row = self._get("heads", url)
+        if row is None:
+            return None
+        return json.loads(row[1])
+
+    def put_head(self, url: str, headers: dict):
+        """Cache the relevant headers of the video at url."""
+        with self._lock, self._db:
+            self._db.execute("REPLACE INTO heads VALUES (?, ?, ?)",
+                             (url, json.dumps(headers), time.time()))
+
+    def invalidate(self, url: str):
+        """Forget everything cached for url (page or video)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._db.execute("DELETE FROM heads WHERE url = ?", (url,))
+
+    def close(self):
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
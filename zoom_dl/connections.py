@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the HTTP session shared by every download, and its connections."""
+
+import socket
+import threading
+from typing import List, Optional, Tuple
+
+import requests
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# connections kept alive per host by default, as requests does
+DEFAULT_POOL_SIZE = 10
+
+
+class ConnectionMetrics():
+    """Count the requests sent and the connections opened to send them.
+
+    A request not opening a connection reused one kept alive.
+    """
+
+    def __init__(self):
+        """Init the counts to 0."""
+        self.requests = 0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        """Count a request sent."""
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self):
+        """Count a connection opened."""
+        with self._lock:
+            self.opened += 1
+
+    @property
+    def reused(self) -> int:
+        """Return the count of requests sent over a kept-alive connection."""
+        return max(0, self.requests - self.opened)
+
+
+def _counting_pool(pool_class, metrics: ConnectionMetrics):
+    """Return a subclass of pool_class counting its new connections."""
+
+    class CountingPool(pool_class):
+
+        def _new_conn(self):
+            metrics.count_connection()
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class PoolAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter with a tunable pool and socket options, and metrics.
+
+    The pool manager of an adapter is thread-safe, so a session using it
+    can be shared by every worker.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 socket_options: Optional[List[Tuple[int, int, int]]] = None):
+        """Init the adapter.
+
+        Args:
+            pool_size (int): connections kept alive per host
+            socket_options (list, optional): (level, option, value) set on
+                every new socket, default to urllib3's (TCP_NODELAY)
+        """
+        # used by init_poolmanager, called by HTTPAdapter.__init__
+        self.metrics = ConnectionMetrics()
+        self._socket_options = socket_options
+        super().__init__(pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Create the pool manager, with counting pools."""
+        if self._socket_options is not None:
+            kwargs["socket_options"] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.metrics),
+            "https": _counting_pool(HTTPSConnectionPool, self.metrics)}
+
+    def send(self, request, **kwargs):
+        """Send a request, counting it."""
+        self.metrics.count_request()
+        return super().send(request, **kwargs)
+
+
+def socket_options(keepalive: int = 0,
+                   recv_buffer: int = 0) -> List[Tuple[int, int, int]]:
+    """Return the options of the sockets of the session.
+
+    Args:
+        keepalive (int): seconds a connection may be idle before TCP
+            keep-alive probes are sent, 0 to not send any
+        recv_buffer (int): size of the receive buffer of the sockets in
+            bytes, 0 to let the OS decide
+    """
+    options = list(HTTPConnection.default_socket_options)
+    if keepalive:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive),
+                        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                         max(1, keepalive // 4))]
+        elif hasattr(socket, "TCP_KEEPALIVE"):
+            # macOS
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE,
+                            keepalive))
+    if recv_buffer:
+        options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer))
+    return options
+
+
+def make_session(pool_size: int = DEFAULT_POOL_SIZE, keepalive: int = 0,
+                 recv_buffer: int = 0) -> requests.Session:
+    """Return a session sending every request through one PoolAdapter.
+
+    See PoolAdapter and socket_options for the arguments. The metrics are
+    available as `session.get_adapter(url).metrics`.
+    """
+    session = requests.Session()
+    adapter = PoolAdapter(pool_size, socket_options(keepalive, recv_buffer))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the cookie jars loading and saving cookies files."""
+
+import collections
+import copy
+import io
+import os
+import sys
+import threading
+import time
+from http.cookiejar import CookieJar, LoadError, MozillaCookieJar
+
+
+class ZoomdlCookieJar(MozillaCookieJar):
+    """Define a cookie jar.
+
+    Code freely adapted from Youtube-DL's YoutubeCookieJar
+    https://github.com/ytdl-org/youtube-dl/
+    For file format, see https://curl.haxx.se/docs/http-cookies.html
+    """
+
+    _HTTPONLY_PREFIX = '#HttpOnly_'
+    _ENTRY_LEN = 7
+    _CookieFileEntry = collections.namedtuple(
+        'CookieFileEntry',
+        ('domain_name', 'include_subdomains', 'path',
+         'https_only', 'expires_at', 'name', 'value'))
+
+    def load(self, filename=None, ignore_discard=True, ignore_expires=True):
+        """Load cookies from a file."""
+        if filename is None:
+            if self.filename is not None:
+                filename = self.filename
+            else:
+                raise ValueError()
+
+        def prepare_line(line):
+            # print("Prepping line '{}'".format(line))
+            if line.startswith(self._HTTPONLY_PREFIX):
+                line = line[len(self._HTTPONLY_PREFIX):]
+            # comments and empty lines are fine
+            if line.startswith('#') or not line.strip():
+                return line
+            cookie_list = line.split('\t')
+            if len(cookie_list) != self._ENTRY_LEN:
+                raise ValueError('invalid length %d' % len(cookie_list))
+            cookie = self._CookieFileEntry(*cookie_list)
+            if cookie.expires_at and not cookie.expires_at.isdigit():
+                raise ValueError('invalid expires at %s' % cookie.expires_at)
+            return line
+
+        cf = io.StringIO()
+        with io.open(filename, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    cf.write(prepare_line(line))
+                except ValueError as e:
+                    print(
+                        'WARNING: skipping cookie file entry due to %s: %r\n'
+                        % (e, line), file=sys.stderr)
+                    continue
+        cf.seek(0)
+        self._really_load(cf, filename, ignore_discard, ignore_expires)
+        # Session cookies are denoted by either `expires` field set to
+        # an empty string or 0. MozillaCookieJar only recognizes the former
+        # (see [1]). So we need force the latter to be recognized as session
+        # cookies on our own.
+        # Session cookies may be important for cookies-based authentication,
+        # e.g. usually, when user does not check 'Remember me' check box while
+        # logging in on a site, some important cookies are stored as session
+        # cookies so that not recognizing them will result in failed login.
+        # 1. https://bugs.python.org/issue17164
+        for cookie in self:
+            # Treat `expires=0` cookies as session cookies
+            if cookie.expires == 0:
+                cookie.expires = None
+                cookie.discard = True
+
+
+class SessionStore():
+    """Cookies of the password-protected recordings, kept between runs.
+
+    Once a password is validated, the cookies Zoom set for the domain of
+    the recording are saved, so that the pages of that meeting (and of the
+    others validated before) are available right away to later runs,
+    without validating the password again. Cookies are kept ttl seconds
+    at most, session cookies included, and expired ones are dropped when
+    loading. The file is only readable by its owner.
+    """
+
+    FILENAME = "sessions.txt"
+
+    def __init__(self, directory: str, ttl: int):
+        """Load the saved cookies of directory, if any."""
+        self.path = os.path.join(directory, self.FILENAME)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jar = MozillaCookieJar(self.path)
+        if os.path.isfile(self.path):
+            try:
+                self._jar.load()
+            except (OSError, LoadError):
+                # corrupted file, start over
+                self._jar.clear()
+
+    def restore(self, jar: CookieJar):
+        """Add the saved cookies to jar."""
+        with self._lock:
+            for cookie in self._jar:
+                jar.set_cookie(cookie)
+
+    def save(self, jar: CookieJar, domain: str):
+        """Save the cookies of jar for domain and its subdomains."""
+        expires = int(time.time()) + self.ttl
+        with self._lock:
+            for cookie in list(jar):
+                name = cookie.domain.lstrip(".")
+                if name != domain and not name.endswith("." + domain):
+                    continue
+                cookie = copy.copy(cookie)
+                cookie.expires = min(cookie.expires or expires, expires)
+                cookie.discard = False
+                self._jar.set_cookie(cookie)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            self._jar.save(tmp_path)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
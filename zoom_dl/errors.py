@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the exceptions raised by ZoomDL.
+
+DownloadError, raised when a video can't be downloaded, is defined along
+the transfer helpers.
+"""
+
+
+class ZoomDLError(Exception):
+    """Base class of the errors of ZoomDL."""
+
+
+class InvalidURLError(ZoomDLError):
+    """The url is not the url of a Zoom recording."""
+
+
+class AuthenticationError(ZoomDLError):
+    """The recording is password-protected and the password was refused."""
+
+
+class MetadataError(ZoomDLError):
+    """The metadata of the recording can't be found in its page."""
+
+
+class PageError(ZoomDLError):
+    """The page of the recording can't be loaded."""
+
+    def __init__(self, message, status_code=None):
+        """Init the error, with the HTTP status code if any."""
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OutputExistsError(ZoomDLError):
+    """A file to download already exists, and may not be overwritten."""
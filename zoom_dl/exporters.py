@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the exporters of chat messages and transcripts.
+
+Entries are streamed from the metadata to the file, each one formatted
+into a single string, and the metadata is left untouched.
+"""
+
+import json
+import re
+from typing import Iterable, Iterator, NamedTuple
+
+FORMATS = ["txt", "srt", "vtt", "jsonl"]
+# size of the write buffer of the exported files
+BUFFER_SIZE = 1024 ** 2
+
+# [[hours:]minutes:]seconds[.fraction], anything around is ignored
+_TIMESTAMP_REGEX = re.compile(r"(?:(?:(\d+):)?(\d+):)?(\d+)(?:[.,](\d+))?")
+_VTT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+class Entry(NamedTuple):
+    """One chat message or transcript line, with times in milliseconds."""
+
+    start: int
+    end: int
+    username: str
+    text: str
+    # times as written in plain-text exports
+    label: str
+
+
+def parse_timestamp(value: str) -> int:
+    """Parse a timestamp like `01:23:45.678` into milliseconds.
+
+    Hours, minutes and the fraction of second are optional. An invalid
+    timestamp counts as 0.
+    """
+    seconds, _, fraction = value.partition(".")
+    try:
+        # fast path, for well-formed timestamps
+        total = 0
+        for part in seconds.split(":"):
+            total = total * 60 + int(part)
+        return total * 1000 + (int(fraction[:3].ljust(3, "0"))
+                               if fraction else 0)
+    except ValueError:
+        pass
+    match = _TIMESTAMP_REGEX.search(value)
+    if match is None:
+        return 0
+    hours, minutes, seconds, fraction = match.groups()
+    total = int(seconds) + 60 * int(minutes or 0) + 3600 * int(hours or 0)
+    return total * 1000 + int((fraction or "0")[:3].ljust(3, "0"))
+
+
+def format_timestamp(millis: int, separator: str = ",") -> str:
+    """Format milliseconds as `HH:MM:SS,mmm` (or `.` as separator)."""
+    seconds, millis = divmod(millis, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d%s%03d" % (hours, minutes, seconds, separator,
+                                     millis)
+
+
+def chat_entries(messages: Iterable[dict],
+                 duration: int = 3) -> Iterator[Entry]:
+    """Return the entries of chat messages, shown duration seconds each.
+
+    Chat times are to the second.
+    """
+    for message in messages:
+        seconds = parse_timestamp(message["time"]) // 1000
+        minutes, label_seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        yield Entry(seconds * 1000, (seconds + duration) * 1000,
+                    message["username"], message["content"],
+                    "%02d:%02d:%02d" % (hours, minutes, label_seconds))
+
+
+def transcript_entries(transcripts: Iterable[dict],
+                       timed: bool = True) -> Iterator[Entry]:
+    """Return the entries of transcript lines.
+
+    Plain-text exports only need the label, so with timed=False the times
+    are not parsed, and left to 0.
+    """
+    for transcript in transcripts:
+        yield Entry(parse_timestamp(transcript["ts"]) if timed else 0,
+                    parse_timestamp(transcript["endTs"]) if timed else 0,
+                    transcript["username"],
+                    transcript["text"],
+                    transcript["ts"] + " --> " + transcript["endTs"])
+
+
+def _format_txt(entries: Iterable[Entry]) -> Iterator[str]:
+    for idx, entry in enumerate(entries):
+        yield "%s[%s] @ %s :\n%s\n" % ("\n" if idx else "", entry.username,
+                                       entry.label, entry.text)
+
+
+def _format_srt(entries: Iterable[Entry]) -> Iterator[str]:
+    for idx, entry in enumerate(entries):
+        yield "%s%d\n%s --> %s\n%s: %s\n" % (
+            "\n" if idx else "", idx + 1, format_timestamp(entry.start),
+            format_timestamp(entry.end), entry.username, entry.text)
+
+
+def _format_vtt(entries: Iterable[Entry]) -> Iterator[str]:
+    yield "WEBVTT\n"
+    for entry in entries:
+        yield "\n{} --> {}\n{}: {}\n".format(
+            format_timestamp(entry.start, "."),
+            format_timestamp(entry.end, "."),
+            entry.username.translate(_VTT_ESCAPES),
+            # a blank line would end the cue
+            "\n".join(line for line in
+                      entry.text.translate(_VTT_ESCAPES).splitlines()
+                      if line.strip()))
+
+
+def _format_jsonl(entries: Iterable[Entry]) -> Iterator[str]:
+    for entry in entries:
+        yield json.dumps({"start": entry.start / 1000,
+                          "end": entry.end / 1000,
+                          "username": entry.username,
+                          "text": entry.text}) + "\n"
+
+
+_FORMATTERS = {"txt": _format_txt,
+               "srt": _format_srt,
+               "vtt": _format_vtt,
+               "jsonl": _format_jsonl}
+
+
+def export(entries: Iterable[Entry], path: str, fmt: str):
+    """Write entries to path, in one of FORMATS."""
+    with open(path, "w", encoding="utf-8", buffering=BUFFER_SIZE) as f:
+        f.writelines(_FORMATTERS[fmt](entries))
+
+
+def write_chat(messages: Iterable[dict], path: str, fmt: str,
+               duration: int = 3):
+    """Write chat messages to path, see chat_entries and export."""
+    export(chat_entries(messages, duration), path, fmt)
+
+
+def write_transcript(transcripts: Iterable[dict], path: str, fmt: str):
+    """Write transcript lines to path, see transcript_entries and export."""
+    export(transcript_entries(transcripts, timed=fmt != "txt"), path, fmt)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the manifest of completed downloads of an output directory."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+def file_checksum(path: str) -> str:
+    """Return the SHA-256 hex digest of the file at path."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest():
+    """Append-only record of the files completely downloaded in a directory.
+
+    Entries are keyed by (url, clip, stream), stream being "camera",
+    "screen", "chat",... and are stored as JSON lines in a hidden file of
+    the directory. The whole manifest is loaded in memory, so lookups don't
+    need any I/O besides checking the size of the file.
+    """
+
+    FILENAME = ".zoomdl-manifest.jsonl"
+
+    def __init__(self, directory: str):
+        """Load the manifest of directory, if it exists."""
+        self.path = os.path.join(directory, self.FILENAME)
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # truncated last line, after a crash
+                        continue
+                    key = (entry["url"], entry["clip"], entry["stream"])
+                    self._entries[key] = entry
+
+    def get(self, url: str, clip: Optional[int], stream: str):
+        """Return the entry of a downloaded file, or None."""
+        return self._entries.get((url, clip, stream))
+
+    def is_complete(self, url: str, clip: Optional[int], stream: str,
+                    filepath: str) -> bool:
+        """Check that a file was completely downloaded, and is still there.
+        """
+        entry = self.get(url, clip, stream)
+        return (entry is not None and
+                entry["filename"] == os.path.basename(filepath) and
+                os.path.isfile(filepath) and
+                os.path.getsize(filepath) == entry["size"])
+
+    def add(self, url: str, clip: Optional[int], stream: str, filepath: str,
+            checksum: Optional[str] = None):
+        """Record that filepath was completely downloaded."""
+        entry = {"url": url,
+                 "clip": clip,
+                 "stream": stream,
+                 "filename": os.path.basename(filepath),
+                 "size": os.path.getsize(filepath),
+                 "sha256": checksum or file_checksum(filepath),
+                 "time": time.time()}
+        with self._lock:
+            self._entries[(url, clip, stream)] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the compressed, append-only store of recordings metadata."""
+
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# size after which a new segment file is started
+SEGMENT_SIZE = 64 * 1024 ** 2
+_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+_SEGMENT_REGEX = re.compile(r"^metadata-(\d+)\.jsonl\.(gz|zst)$")
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is needed to read zstd segments")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class MetadataStore():
+    """Store of page metadata, appended to compressed JSON-lines segments.
+
+    Each record (the url, clip, time and metadata of a page) is compressed
+    on its own, as one gzip member or zstd frame, so that a whole segment
+    is still a valid compressed JSON-lines file, and a record can be read
+    by seeking to it. Their offsets are indexed by url and clip in SQLite.
+    Records are never rewritten: the index points to the latest one.
+
+    zstd is used if the zstandard module is installed, gzip otherwise.
+    """
+
+    def __init__(self, directory: str, compression: str = None):
+        """Open (or create) the store in directory.
+
+        Args:
+            compression (str, optional): "gzip" or "zstd", see above
+        """
+        if compression is None:
+            compression = "gzip" if zstandard is None else "zstd"
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstandard is needed for zstd compression")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"),
+                                   timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS records ("
+                             "url TEXT, clip INTEGER, segment TEXT, "
+                             "offset INTEGER, length INTEGER, created REAL, "
+                             "PRIMARY KEY (url, clip))")
+        # go on with the last segment, unless of the other compression
+        segments = sorted((int(match.group(1)), "." + match.group(2))
+                          for match in map(_SEGMENT_REGEX.match,
+                                           os.listdir(directory))
+                          if match)
+        self._number = 1
+        if segments:
+            number, extension = segments[-1]
+            self._number = (number if extension == _EXTENSIONS[compression]
+                            else number + 1)
+        self._segment = self._segment_name(self._number)
+
+    def _segment_name(self, number: int) -> str:
+        return "metadata-{:06d}.jsonl{}".format(
+            number, _EXTENSIONS[self.compression])
+
+    def _next_segment(self, size: int) -> str:
+        """Return the segment to append size bytes to."""
+        path = os.path.join(self.directory, self._segment)
+        if (os.path.exists(path) and
+                os.path.getsize(path) + size > SEGMENT_SIZE):
+            self._number += 1
+            self._segment = self._segment_name(self._number)
+        return self._segment
+
+    def append(self, url: str, clip: Optional[int], metadata: dict) -> int:
+        """Append the metadata of a page to the store.
+
+        Returns:
+            int: size of the compressed record
+        """
+        record = json.dumps({"url": url, "clip": clip, "time": time.time(),
+                             "metadata": metadata}) + "\n"
+        data = _compress(record.encode("utf-8"), self.compression)
+        with self._lock:
+            segment = self._next_segment(len(data))
+            # appends are atomic, even from several processes
+            with open(os.path.join(self.directory, segment), "ab") as f:
+                f.write(data)
+                f.flush()
+                offset = f.tell() - len(data)
+            with self._db:
+                self._db.execute(
+                    "REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, clip or 0, segment, offset, len(data),
+                     time.time()))
+        return len(data)
+
+    def _read(self, segment: str, offset: int, length: int) -> dict:
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        compression = "zstd" if segment.endswith(".zst") else "gzip"
+        return json.loads(_decompress(data, compression))
+
+    def locate(self, url: str,
+               clip: Optional[int] = None) -> Optional[Tuple[str, int, int]]:
+        """Return the segment, offset and length of the latest record."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT segment, offset, length FROM records "
+                "WHERE url = ? AND clip = ?", (url, clip or 0)).fetchone()
+
+    def get(self, url: str, clip: Optional[int] = None) -> Optional[dict]:
+        """Return the latest metadata of the page of url, if stored."""
+        location = self.locate(url, clip)
+        if location is None:
+            return None
+        return self._read(*location)["metadata"]
+
+    def records(self) -> Iterator[dict]:
+        """Return the latest record of every page, in the order stored.
+
+        Records are dicts with the keys url, clip, time and metadata.
+        """
+        with self._lock:
+            locations = self._db.execute(
+                "SELECT segment, offset, length FROM records "
+                "ORDER BY segment, offset").fetchall()
+        for location in locations:
+            yield self._read(*location)
+
+    def close(self):
+        """Close the underlying index."""
+        with self._lock:
+            self._db.close()
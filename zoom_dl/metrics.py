@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the live metrics of the downloads, served over HTTP."""
+
+import http.server
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds of the buckets of the histograms, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# seconds over which the throughput is averaged
+RATE_WINDOW = 10
+
+
+class Histogram():
+    """Distribution of durations, as Prometheus histograms."""
+
+    def __init__(self):
+        """Init the histogram, empty."""
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Count a duration."""
+        for idx, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str) -> list:
+        """Return the lines of the histogram in the text format."""
+        lines = ['{}_bucket{{le="{}"}} {}'.format(name, bound, count)
+                 for bound, count in zip(BUCKETS, self.counts)]
+        lines += ['{}_bucket{{le="+Inf"}} {}'.format(name, self.count),
+                  "{}_sum {}".format(name, self.sum),
+                  "{}_count {}".format(name, self.count)]
+        return lines
+
+
+class Metrics():
+    """Counters and gauges of the downloads, see --metrics-port.
+
+    It is a hook of Stats (for phases and retries), and is also told about
+    every block downloaded (see ZoomDL._throttle), every stream started
+    and every failed request (see ZoomDL._request).
+    """
+
+    def __init__(self):
+        """Init every metric to 0."""
+        self._lock = threading.Lock()
+        self.bytes = 0
+        # bytes by second, for the throughput
+        self._window = {}
+        self.active_streams = 0
+        self.queue_depth = 0
+        self.retries = 0
+        self.failures = {}
+        self.phases = {}
+        self.parse = Histogram()
+
+    def __call__(self, event: dict):
+        """Account for an event of Stats."""
+        with self._lock:
+            phase = self.phases.setdefault(event["phase"], [0, 0.0, 0])
+            phase[0] += 1
+            phase[1] += event["duration"]
+            phase[2] += "error" in event
+            if event["phase"] == "parse":
+                self.parse.observe(event["duration"])
+            elif event["phase"] == "transfer" and event.get("attempt"):
+                self.retries += 1
+
+    def count_bytes(self, size: int):
+        """Count a block downloaded."""
+        second = int(time.monotonic())
+        with self._lock:
+            self.bytes += size
+            self._window[second] = self._window.get(second, 0) + size
+
+    def count_failure(self, kind: str, status_code: int = None):
+        """Count a failed HTTP request, by kind and status code if any.
+
+        Args:
+            kind (str): "page", "head" or "video"
+            status_code (int, optional): None for network errors
+        """
+        key = (kind, str(status_code or "none"))
+        with self._lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    def dequeue(self):
+        """Count a recording taken from the queue."""
+        with self._lock:
+            self.queue_depth -= 1
+
+    @contextmanager
+    def stream(self):
+        """Count the stream downloading in the context as active."""
+        with self._lock:
+            self.active_streams += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active_streams -= 1
+
+    def throughput(self) -> float:
+        """Return the bytes per second of the last RATE_WINDOW seconds."""
+        now = int(time.monotonic())
+        with self._lock:
+            for second in [second for second in self._window
+                           if second < now - RATE_WINDOW]:
+                del self._window[second]
+            total = sum(size for second, size in self._window.items()
+                        if second < now)
+        return total / RATE_WINDOW
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text format."""
+        throughput = self.throughput()
+        with self._lock:
+            lines = [
+                "# HELP zoomdl_downloaded_bytes_total Bytes of videos "
+                "downloaded.",
+                "# TYPE zoomdl_downloaded_bytes_total counter",
+                "zoomdl_downloaded_bytes_total {}".format(self.bytes),
+                "# HELP zoomdl_throughput_bytes Bytes downloaded per second, "
+                "over the last {} seconds.".format(RATE_WINDOW),
+                "# TYPE zoomdl_throughput_bytes gauge",
+                "zoomdl_throughput_bytes {}".format(throughput),
+                "# HELP zoomdl_active_streams Videos being downloaded.",
+                "# TYPE zoomdl_active_streams gauge",
+                "zoomdl_active_streams {}".format(self.active_streams),
+                "# HELP zoomdl_queue_depth Recordings waiting to be "
+                "downloaded.",
+                "# TYPE zoomdl_queue_depth gauge",
+                "zoomdl_queue_depth {}".format(self.queue_depth),
+                "# HELP zoomdl_retries_total Transfers tried again.",
+                "# TYPE zoomdl_retries_total counter",
+                "zoomdl_retries_total {}".format(self.retries),
+                "# HELP zoomdl_failures_total Failed HTTP requests, by kind "
+                "(page, head, video) and status code (none for network "
+                "errors).",
+                "# TYPE zoomdl_failures_total counter"]
+            lines += ['zoomdl_failures_total{{kind="{}",status="{}"}} {}'
+                      .format(kind, status, count)
+                      for (kind, status), count in self.failures.items()]
+            lines += [
+                "# HELP zoomdl_phases_total Phases finished, by phase.",
+                "# TYPE zoomdl_phases_total counter"]
+            lines += ['zoomdl_phases_total{{phase="{}"}} {}'.format(
+                name, phase[0]) for name, phase in self.phases.items()]
+            lines += [
+                "# HELP zoomdl_phase_seconds_total Time spent in phases, "
+                "by phase.",
+                "# TYPE zoomdl_phase_seconds_total counter"]
+            lines += ['zoomdl_phase_seconds_total{{phase="{}"}} {}'.format(
+                name, phase[1]) for name, phase in self.phases.items()]
+            lines += [
+                "# HELP zoomdl_phase_errors_total Phases failed, by phase.",
+                "# TYPE zoomdl_phase_errors_total counter"]
+            lines += ['zoomdl_phase_errors_total{{phase="{}"}} {}'.format(
+                name, phase[2]) for name, phase in self.phases.items()]
+            lines += [
+                "# HELP zoomdl_parse_seconds Time spent parsing pages.",
+                "# TYPE zoomdl_parse_seconds histogram"]
+            lines += self.parse.lines("zoomdl_parse_seconds")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # scrapes would clutter the output
+        pass
+
+
+def serve_metrics(metrics: Metrics, port: int,
+                  host: str = "127.0.0.1") -> http.server.HTTPServer:
+    """Serve metrics at http://host:port/metrics, from a daemon thread.
+
+    Returns:
+        HTTPServer: the server, to `shutdown()` it
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics",
+                     daemon=True).start()
+    return server
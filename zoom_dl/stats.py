@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the instrumentation of the phases of a download."""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class Stats():
+    """Collect the wall time and bytes of every phase of the downloads.
+
+    A phase is one of "page", "authenticate", "parse", "head", "transfer",
+    "rename", "chat", "transcript" or "meta". Each finished phase produces
+    an event, a dict like:
+
+        {"phase": "transfer", "url": ..., "clip": 1, "stream": "camera",
+         "start": 1600000000.0, "duration": 12.3, "bytes": 123456}
+
+    with an "error" key if the phase failed. Events are passed to every
+    hook, in the thread running the phase.
+    """
+
+    def __init__(self):
+        """Init the stats, without any hook."""
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def add_hook(self, hook: Callable[[dict], object]):
+        """Call hook with every event from now on."""
+        self._hooks.append(hook)
+
+    @contextmanager
+    def phase(self, phase: str, url: str, clip: Optional[int] = None,
+              **fields):
+        """Measure the phase running in the context.
+
+        The context gets the event, so that bytes (or any other field) can
+        be added to it before it is emitted.
+        """
+        event = dict(phase=phase, url=url, clip=clip, **fields)
+        event["start"] = time.time()
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as exc:
+            event["error"] = str(exc) or type(exc).__name__
+            raise
+        finally:
+            event["duration"] = time.perf_counter() - start
+            self.emit(event)
+
+    def emit(self, event: dict):
+        """Account for an event and pass it to the hooks."""
+        with self._lock:
+            total = self.totals.setdefault(event["phase"], {"count": 0,
+                                                            "duration": 0.0,
+                                                            "bytes": 0})
+            total["count"] += 1
+            total["duration"] += event["duration"]
+            total["bytes"] += event.get("bytes") or 0
+        for hook in self._hooks:
+            hook(event)
+
+
+class StatsFile():
+    """Hook appending the events as JSON lines to a file."""
+
+    def __init__(self, path: str):
+        """Init the hook, the file is opened at the first event."""
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        """Append event to the file."""
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """Close the file, it is opened again by the next event."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define helpers used to transfer video files."""
+
+import datetime
+import email.utils
+import errno
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import requests
+import urllib3
+
+from .errors import ZoomDLError
+
+# size of the blocks read from the network and written to disk
+BLOCK_SIZE = 1024 ** 2
+# status codes worth retrying as is
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# status codes meaning the signed url of a video likely expired
+EXPIRED_STATUS_CODES = {401, 403, 410}
+# `bytes first-last/total`, or `bytes */total` for an unsatisfiable range
+_CONTENT_RANGE_REGEX = re.compile(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)")
+# errors raised by a dropped or stalled connection
+NETWORK_ERRORS = (requests.exceptions.RequestException,
+                  urllib3.exceptions.HTTPError,
+                  ConnectionError,
+                  socket.timeout)
+
+
+class DownloadError(ZoomDLError):
+    """Error while downloading a video, possibly temporary."""
+
+    def __init__(self, message, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None,
+                 retryable: Optional[bool] = None):
+        """Init the error.
+
+        Args:
+            message (str): description of the error
+            status_code (int, optional): HTTP status code, if any
+            retry_after (float, optional): delay asked by the server
+            retryable (bool, optional): whether retrying may help. By
+                default, errors without status code (network errors) and
+                with a status code of RETRY_STATUS_CODES or
+                EXPIRED_STATUS_CODES are retryable.
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        if retryable is None:
+            retryable = (status_code is None or
+                         status_code in RETRY_STATUS_CODES or
+                         status_code in EXPIRED_STATUS_CODES)
+        self.retryable = retryable
+
+    @classmethod
+    def from_response(cls, response):
+        """Create the error of an unexpected response."""
+        return cls("Status code: {}".format(response.status_code),
+                   response.status_code,
+                   parse_retry_after(response.headers.get("retry-after")))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, either in seconds or an HTTP date.
+
+    Returns:
+        float: count of seconds to wait, or None if value is invalid
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+def parse_content_range(value: Optional[str]
+                        ) -> Tuple[Optional[int], Optional[int]]:
+    """Parse a Content-Range header, like `bytes 0-99/1000`.
+
+    Returns:
+        tuple: first byte of the range and size of the whole file, each
+        None if unknown
+    """
+    match = _CONTENT_RANGE_REGEX.match(value or "")
+    if match is None:
+        return None, None
+    first, total = match.groups()
+    return (int(first) if first else None,
+            int(total) if total != "*" else None)
+
+
+def response_total_size(response) -> int:
+    """Return the size of the whole file of a (ranged) GET response.
+
+    Returns:
+        int: the size, or 0 if unknown
+    """
+    if response.status_code == 200:
+        return int(response.headers.get("content-length") or 0)
+    return parse_content_range(response.headers.get("content-range"))[1] or 0
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = 1.0, cap: float = 60.0,
+                  max_retry_after: float = 300.0) -> float:
+    """Return how long to wait before retry number `attempt` (from 0).
+
+    Exponential backoff with full jitter, unless the server asked for a
+    specific delay, which is followed up to max_retry_after seconds (the
+    worker keeps its slot of the host while waiting).
+    """
+    if retry_after is not None:
+        return min(max(0.0, retry_after), max(cap, max_retry_after))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket():
+    """Token bucket limiting a rate, shared by any number of threads.
+
+    Tokens (bytes, requests,...) are refilled at `rate` per second, up to
+    `capacity`. Consuming more tokens than available is allowed, but the
+    caller then sleeps until the debt is paid back, so large blocks are
+    fine and the long-term rate is respected whatever the block sizes.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Init a full bucket.
+
+        Args:
+            rate (float): tokens added per second
+            capacity (float, optional): maximum burst, default to rate
+        """
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float = 1):
+        """Take amount tokens, sleeping as long as needed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def split_ranges(total_size: int, count: int) -> List[Tuple[int, int]]:
+    """Split `total_size` bytes into `count` contiguous ranges.
+
+    Ranges are inclusive on both ends, as in an HTTP `Range` header.
+    """
+    count = max(1, min(count, total_size))
+    seg_size, rem = divmod(total_size, count)
+    ranges = []
+    start = 0
+    for idx in range(count):
+        end = start + seg_size + (1 if idx < rem else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def copy_stream(response, vid_file,
+                update: Optional[Callable[[int], object]] = None,
+                length: Optional[int] = None,
+                fsync_every: int = 0,
+                stop=None,
+                throttle: Optional[Callable[[int], object]] = None,
+                block_size: int = BLOCK_SIZE,
+                digest=None) -> int:
+    """Copy the body of a streamed response to vid_file.
+
+    The body is read in blocks of block_size into a single reusable buffer,
+    and written from a memoryview of it, so there is one write (and one
+    progress update) per block instead of one per KiB.
+
+    Args:
+        response (requests.Response): response opened with `stream=True`
+        vid_file: file opened in binary mode, positioned where to write
+        update (callable, optional): called with the size of every block
+            written, typically a progress bar update
+        length (int, optional): stop after that many bytes
+        fsync_every (int, optional): fsync the file every time that many
+            bytes have been written (0 to never fsync)
+        stop (threading.Event, optional): abort the copy once set
+        throttle (callable, optional): called with the size of every block
+            read, sleeping to limit the rate (see TokenBucket)
+        block_size (int, optional): maximum size of the blocks, smaller
+            blocks make a limited rate smoother
+        digest (hashlib hash, optional): updated with every block
+            written, to checksum the file without reading it again
+
+    Returns:
+        int: count of bytes written
+    """
+    if response.headers.get("content-encoding", "identity") != "identity":
+        # compressed body, let requests decode it
+        return _copy_decoded(response, vid_file, update, length,
+                             fsync_every, stop, throttle, block_size, digest)
+    buffer = memoryview(bytearray(block_size))
+    written = 0
+    unsynced = 0
+    while length is None or written < length:
+        if stop is not None and stop.is_set():
+            break
+        to_read = block_size
+        if length is not None:
+            to_read = min(to_read, length - written)
+        read = response.raw.readinto(buffer[:to_read])
+        if not read:
+            break
+        if throttle is not None:
+            throttle(read)
+        if digest is not None:
+            digest.update(buffer[:read])
+        vid_file.write(buffer[:read])
+        written += read
+        if update is not None:
+            update(read)
+        if fsync_every:
+            unsynced += read
+            if unsynced >= fsync_every:
+                _fsync(vid_file)
+                unsynced = 0
+    if fsync_every and unsynced:
+        _fsync(vid_file)
+    return written
+
+
+def _fsync(vid_file):
+    vid_file.flush()
+    os.fsync(vid_file.fileno())
+
+
+def _copy_decoded(response, vid_file, update, length, fsync_every, stop,
+                  throttle, block_size, digest) -> int:
+    """Copy a content-encoded response body, see copy_stream."""
+    written = 0
+    unsynced = 0
+    for data in response.iter_content(block_size):
+        if stop is not None and stop.is_set():
+            break
+        if throttle is not None:
+            throttle(len(data))
+        if length is not None:
+            data = data[:length - written]
+        if digest is not None:
+            digest.update(data)
+        vid_file.write(data)
+        written += len(data)
+        if update is not None:
+            update(len(data))
+        if fsync_every:
+            unsynced += len(data)
+            if unsynced >= fsync_every:
+                _fsync(vid_file)
+                unsynced = 0
+        if length is not None and written >= length:
+            break
+    if fsync_every and unsynced:
+        _fsync(vid_file)
+    return written
+
+
+def hash_file(path: str, digest, size: Optional[int] = None,
+              block_size: int = BLOCK_SIZE):
+    """Update digest with the first size bytes (default all) of a file."""
+    with open(path, "rb") as f:
+        while size is None or size > 0:
+            block = f.read(block_size if size is None
+                           else min(block_size, size))
+            if not block:
+                break
+            digest.update(block)
+            if size is not None:
+                size -= len(block)
+
+
+def write_checksum(path: str, checksum: str):
+    """Write the SHA-256 checksum of path next to it, like sha256sum."""
+    with open(path + ".sha256", "w", encoding="utf-8") as f:
+        f.write("{}  {}\n".format(checksum, os.path.basename(path)))
+
+
+def get_validator(headers) -> Optional[str]:
+    """Return what identifies the version of a remote file, for If-Range.
+
+    Weak ETags can't be used in If-Range, Last-Modified is used instead.
+
+    Returns:
+        str: the validator, or None if the server sent none
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+def load_validator(path: str) -> Optional[str]:
+    """Load the validator sidecar of a partial download, or None."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def save_validator(path: str, validator: str):
+    """Save the validator sidecar of a partial download."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(validator + "\n")
+
+
+def allocated_size(path: str) -> int:
+    """Return how many bytes of the file at path are allocated on disk.
+
+    Sparse files (e.g. extended with truncate) allocate less than their
+    size. Missing files allocate nothing.
+    """
+    if not os.path.exists(path):
+        return 0
+    stat = os.stat(path)
+    if hasattr(stat, "st_blocks"):
+        return min(stat.st_size, stat.st_blocks * 512)
+    return stat.st_size
+
+
+def check_free_space(path: str, needed: int):
+    """Check that needed more bytes can be written in path's directory.
+
+    Raises:
+        DownloadError: (not retryable) if the disk is too full
+    """
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+    if free < needed:
+        raise DownloadError("Not enough space left to download {}: "
+                            "{:.1f} MiB needed, {:.1f} MiB free".format(
+                                os.path.basename(path), needed / 1024**2,
+                                free / 1024**2),
+                            retryable=False)
+
+
+def preallocate(path: str, size: int, reserve: bool = False):
+    """Extend the file at path (created if needed) to size bytes.
+
+    By default the file is sparse. With reserve, the disk blocks are
+    allocated up front (posix_fallocate), so that the file is not
+    fragmented and a full disk fails now rather than in the middle of the
+    download. Filesystems not supporting it fall back to a sparse file.
+
+    Raises:
+        DownloadError: (not retryable) if the disk is too full
+    """
+    with open(path, "ab") as vid_file:
+        if reserve and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(vid_file.fileno(), 0, size)
+                return
+            except OSError as exc:
+                if exc.errno in (errno.ENOSPC, errno.EDQUOT):
+                    raise DownloadError("Not enough space left to "
+                                        "preallocate {}: {}".format(
+                                            os.path.basename(path), exc),
+                                        retryable=False)
+                if exc.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+        vid_file.truncate(size)
+
+
+def load_segments(path: str, total_size: int) -> Optional[dict]:
+    """Load the segments sidecar of a partial download.
+
+    Returns:
+        dict: the saved state, or None if missing or not matching
+        `total_size` (e.g. the remote file changed).
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except ValueError:
+        return None
+    if state.get("total_size") != total_size:
+        return None
+    state["segments"] = [tuple(seg) for seg in state["segments"]]
+    state["done"] = [tuple(seg) for seg in state["done"]]
+    return state
+
+
+def save_segments(path: str, state: dict, data_path: str = None):
+    """Atomically and durably save the segments sidecar of a download.
+
+    Args:
+        data_path (str, optional): the partial file described by state,
+            synced to disk first, so that a crash never leaves ranges
+            marked as done without their bytes
+    """
+    if data_path is not None:
+        with open(data_path, "r+b") as vid_file:
+            os.fsync(vid_file.fileno())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        _fsync(f)
+    os.replace(tmp_path, path)
@@ -4,77 +4,92 @@
 
 import argparse
 import os
-from http.cookiejar import MozillaCookieJar
-import collections
 import io
+import re
 import sys
-from typing import List
+from typing import List, Optional, Pattern
 
+from .exporters import FORMATS
 
-class ZoomdlCookieJar(MozillaCookieJar):
-    """Define a cookie jar.
 
-    Code freely adapted from Youtube-DL's YoutubeCookieJar
-    https://github.com/ytdl-org/youtube-dl/
-    For file format, see https://curl.haxx.se/docs/http-cookies.html
+# braces, and string literals to skip (a lone quote matches nothing)
+_BRACES_REGEX = re.compile(r"""[{}]
+                               |"(?:[^"\\\n]|\\.)*"
+                               |'(?:[^'\\\n]|\\.)*'
+                               |`(?:[^`\\]|\\.)*`""", re.S | re.X)
+# what differs between a JS object literal and JSON, in the simple cases
+_JS_TO_JSON_REGEX = re.compile(r"""(?P<dq>"(?:[^"\\\n]|\\.)*")
+                                   |(?P<sq>'(?:[^'\\\n]|\\.)*')
+                                   |(?P<key>[A-Za-z_$][\w$]*)(?=\s*:)
+                                   |,(?=\s*[}\]])""", re.S | re.X)
+_SQ_ESCAPES_REGEX = re.compile(r'\\.|"', re.S)
+
+
+def _match_braces(text: str, start: int) -> Optional[int]:
+    """Return the index after the brace closing the one at text[start]."""
+    depth = 0
+    for match in _BRACES_REGEX.finditer(text, start):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return None
+
+
+def find_js_objects(text: str, prefix: Pattern) -> List[str]:
+    """Find the JS object literals following each match of prefix in text.
+
+    The end of an object is found by matching braces and skipping string
+    literals, so the text is scanned once without any backtracking.
+
+    Args:
+        text (str): text to scan, typically a web page
+        prefix (Pattern): compiled regex ending right before the `{`
     """
+    objects = []
+    pos = 0
+    while True:
+        match = prefix.search(text, pos)
+        if match is None:
+            break
+        end = _match_braces(text, match.end())
+        if end is None:
+            break
+        objects.append(text[match.end():end])
+        pos = end
+    return objects
+
 
-    _HTTPONLY_PREFIX = '#HttpOnly_'
-    _ENTRY_LEN = 7
-    _CookieFileEntry = collections.namedtuple(
-        'CookieFileEntry',
-        ('domain_name', 'include_subdomains', 'path',
-         'https_only', 'expires_at', 'name', 'value'))
-
-    def load(self, filename=None, ignore_discard=True, ignore_expires=True):
-        """Load cookies from a file."""
-        if filename is None:
-            if self.filename is not None:
-                filename = self.filename
-            else:
-                raise ValueError()
-
-        def prepare_line(line):
-            # print("Prepping line '{}'".format(line))
-            if line.startswith(self._HTTPONLY_PREFIX):
-                line = line[len(self._HTTPONLY_PREFIX):]
-            # comments and empty lines are fine
-            if line.startswith('#') or not line.strip():
-                return line
-            cookie_list = line.split('\t')
-            if len(cookie_list) != self._ENTRY_LEN:
-                raise ValueError('invalid length %d' % len(cookie_list))
-            cookie = self._CookieFileEntry(*cookie_list)
-            if cookie.expires_at and not cookie.expires_at.isdigit():
-                raise ValueError('invalid expires at %s' % cookie.expires_at)
-            return line
-
-        cf = io.StringIO()
-        with io.open(filename, encoding='utf-8') as f:
-            for line in f:
-                try:
-                    cf.write(prepare_line(line))
-                except ValueError as e:
-                    print(
-                        'WARNING: skipping cookie file entry due to %s: %r\n'
-                        % (e, line), sys.stderr)
-                    continue
-        cf.seek(0)
-        self._really_load(cf, filename, ignore_discard, ignore_expires)
-        # Session cookies are denoted by either `expires` field set to
-        # an empty string or 0. MozillaCookieJar only recognizes the former
-        # (see [1]). So we need force the latter to be recognized as session
-        # cookies on our own.
-        # Session cookies may be important for cookies-based authentication,
-        # e.g. usually, when user does not check 'Remember me' check box while
-        # logging in on a site, some important cookies are stored as session
-        # cookies so that not recognizing them will result in failed login.
-        # 1. https://bugs.python.org/issue17164
-        for cookie in self:
-            # Treat `expires=0` cookies as session cookies
-            if cookie.expires == 0:
-                cookie.expires = None
-                cookie.discard = True
+def _single_to_double_quote(match) -> str:
+    if match.group() == '"':
+        return '\\"'
+    if match.group() == "\\'":
+        return "'"
+    return match.group()
+
+
+def _js_token_to_json(match) -> str:
+    if match.group("dq") is not None:
+        return match.group("dq")
+    if match.group("sq") is not None:
+        return '"' + _SQ_ESCAPES_REGEX.sub(_single_to_double_quote,
+                                           match.group("sq")[1:-1]) + '"'
+    if match.group("key") is not None:
+        return '"' + match.group("key") + '"'
+    return ""  # trailing comma
+
+
+def js_to_json(text: str) -> str:
+    """Convert a simple JS object literal to JSON.
+
+    Quotes bare keys, turns single-quoted strings to double-quoted ones and
+    drops trailing commas. Anything more exotic is left untouched, and will
+    make the JSON decoding fail.
+    """
+    return _JS_TO_JSON_REGEX.sub(_js_token_to_json, text)
 
 
 def _check_positive(value):
@@ -86,6 +101,35 @@ def _check_positive(value):
     return int_value
 
 
+def _check_strictly_positive(value):
+    """Ensure a given value is a strictly positive integer."""
+    int_value = int(value)
+    if int_value <= 0:
+        raise argparse.ArgumentTypeError(
+            "%s is an invalid strictly positive int value" % value)
+    return int_value
+
+
+def _check_rate(value):
+    """Parse a rate in bytes per second, like 500K or 2.5M."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?", value.strip(),
+                         re.I)
+    if match is None:
+        raise argparse.ArgumentTypeError(
+            "%s is an invalid rate (expected e.g. 500K or 2M)" % value)
+    power = " KMG".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def _check_positive_float(value):
+    """Ensure a given value is a positive float."""
+    float_value = float(value)
+    if float_value < 0:
+        raise argparse.ArgumentTypeError(
+            "%s is an invalid positive value" % value)
+    return float_value
+
+
 def _valid_path(value):
     if not (os.path.exists(value) and os.path.isfile(value)):
         raise argparse.ArgumentTypeError(
@@ -93,6 +137,24 @@ def _valid_path(value):
     return value
 
 
+def read_batch_file(path: str) -> List[str]:
+    """Read urls from a batch file, or from stdin if path is '-'.
+
+    Empty lines and lines starting with '#' are skipped.
+    """
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with io.open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+
 def parseOpts(args: List[str]):
     """Parse command line arguments.
 
@@ -108,17 +170,46 @@ def parseOpts(args: List[str]):
                                                 width=200)
                          ))
 
-    PARSER.add_argument("-u", "--url",
-                        help=("Enter the url of the video to download. "
-                              "Looks like 'zoom.us/rec/play/...'"),
-                        type=str,
-                        required=True,
-                        metavar="url")
+    # one is required, unless --daemon, see below
+    URLS = PARSER.add_mutually_exclusive_group()
+    URLS.add_argument("-u", "--url",
+                      help=("Enter the url of the video to download. "
+                            "Looks like 'zoom.us/rec/play/...'"),
+                      type=str,
+                      metavar="url")
+    URLS.add_argument("-a", "--batch-file",
+                      help=("File containing urls to download, one per "
+                            "line. Lines starting with '#' are ignored. "
+                            "Use '-' to read from standard input."),
+                      type=str,
+                      metavar="path/to/urls.txt")
     PARSER.add_argument("-f", "--filename",
                         help=("The name of the output video file without "
                               "extension. Default to the filename according "
-                              "to Zoom. Extension is automatic."),
+                              "to Zoom. Extension is automatic. '-' streams "
+                              "the video to the standard output instead, "
+                              "if there is only one."),
                         metavar="filename")
+    PARSER.add_argument("--output-pipe",
+                        help=("Stream every video to the standard input of "
+                              "a shell command instead of saving it. {} in "
+                              "the command is replaced by the path the "
+                              "video would have."),
+                        metavar="command")
+    PARSER.add_argument("--output-dir",
+                        help=("Directory where files are saved, created if "
+                              "needed. Default to the current directory. A "
+                              "relative filename is relative to it."),
+                        metavar="path/to/dir",
+                        default=None)
+    PARSER.add_argument("--clip-lookahead",
+                        help=("When downloading multiple clips, how many "
+                              "next clips may be downloaded while the "
+                              "current one is. The page of the next clip is "
+                              "always fetched in advance. Default is 0."),
+                        metavar="count",
+                        type=_check_positive,
+                        default=0)
     PARSER.add_argument("-d", "--filename-add-date",
                         help=("Add video meeting date if it is specified. "
                               "Default is not to include the date."),
@@ -140,6 +231,157 @@ def parseOpts(args: List[str]):
                         metavar="Count",
                         type=_check_positive,
                         default=1)
+    PARSER.add_argument("--connections",
+                        help=("Number of parallel connections used to "
+                              "download each video. Default is 1."),
+                        metavar="count",
+                        type=_check_strictly_positive,
+                        default=1)
+    PARSER.add_argument("--retries",
+                        help=("How many times to retry a failed video "
+                              "download, resuming it. Default is 3."),
+                        metavar="count",
+                        type=_check_positive,
+                        default=3)
+    PARSER.add_argument("--timeout",
+                        help=("Seconds without data after which a video "
+                              "download is considered failed. Default is "
+                              "60."),
+                        metavar="seconds",
+                        type=_check_strictly_positive,
+                        default=60)
+    PARSER.add_argument("--fsync-every",
+                        help=("Force downloaded data to disk every given "
+                              "count of MiB. Default is 0 (let the OS "
+                              "decide)."),
+                        metavar="MiB",
+                        type=_check_positive,
+                        default=0)
+    PARSER.add_argument("--checksum",
+                        help=("Save the SHA-256 checksum of every video "
+                              "in a .sha256 file next to it, computed "
+                              "while downloading. Streamed videos get it "
+                              "printed instead."),
+                        action="store_true")
+    PARSER.add_argument("--preallocate",
+                        help=("Reserve the disk space of videos before "
+                              "downloading them, even over a single "
+                              "connection. Default is to let files grow "
+                              "as they are downloaded."),
+                        action="store_true")
+    PARSER.add_argument("--limit-rate",
+                        help=("Maximum download rate in bytes per second, "
+                              "shared by all the downloads, e.g. 500K or 2M. "
+                              "Default is no limit."),
+                        metavar="rate",
+                        type=_check_rate,
+                        default=0)
+    PARSER.add_argument("--limit-rate-per-connection",
+                        help=("Maximum download rate of each connection, "
+                              "e.g. 500K or 2M. Default is no limit."),
+                        metavar="rate",
+                        type=_check_rate,
+                        default=0)
+    PARSER.add_argument("--page-rate",
+                        help=("Maximum number of requests per second to "
+                              "Zoom web pages (not videos), to avoid being "
+                              "throttled. Default is 0 (no limit)."),
+                        metavar="requests",
+                        type=_check_positive_float,
+                        default=0)
+    PARSER.add_argument("-j", "--jobs",
+                        help=("Number of urls to download concurrently "
+                              "when using a batch file. Default is 1."),
+                        metavar="count",
+                        type=_check_strictly_positive,
+                        default=1)
+    PARSER.add_argument("--max-per-host",
+                        help=("Maximum number of videos downloaded at the "
+                              "same time from a single host. Default is 4."),
+                        metavar="count",
+                        type=_check_strictly_positive,
+                        default=4)
+    PARSER.add_argument("--pool-size",
+                        help=("Maximum number of connections kept alive "
+                              "per host, shared by every download. Default "
+                              "is twice the number of connections that may "
+                              "be open at the same time (--jobs times "
+                              "--connections times --clip-lookahead plus 1), "
+                              "and at least 10."),
+                        metavar="count",
+                        type=_check_strictly_positive,
+                        default=None)
+    PARSER.add_argument("--tcp-keepalive",
+                        help=("Send TCP keep-alive probes on connections "
+                              "idle for that many seconds, so that they "
+                              "survive NATs and firewalls between two "
+                              "requests. Default is 0 (disabled)."),
+                        metavar="seconds",
+                        type=_check_positive,
+                        default=0)
+    PARSER.add_argument("--recv-buffer",
+                        help=("Size of the receive buffer of the sockets, "
+                              "like 4M. Larger buffers help on fast links "
+                              "with a high latency. Default is to let the "
+                              "OS decide."),
+                        metavar="size",
+                        type=_check_rate,
+                        default=0)
+    PARSER.add_argument("--manifest",
+                        help=("Record completed downloads in a manifest "
+                              "file of the output directory, and skip "
+                              "them when run again."),
+                        default=False,
+                        action='store_true')
+    PARSER.add_argument("--cache-ttl",
+                        help=("Cache the metadata of the recordings for "
+                              "the given count of seconds, so that a rerun "
+                              "doesn't fetch their pages again. Default is "
+                              "0 (no cache)."),
+                        metavar="seconds",
+                        type=_check_positive,
+                        default=0)
+    PARSER.add_argument("--session-ttl",
+                        help=("Keep the cookies obtained with a password "
+                              "for the given count of seconds at most, so "
+                              "that later runs don't validate it again. "
+                              "Default is 0 (not kept)."),
+                        metavar="seconds",
+                        type=_check_positive,
+                        default=0)
+    PARSER.add_argument("--cache-dir",
+                        help=("Directory of the metadata cache and of the "
+                              "kept cookies. Default is ~/.cache/zoomdl"),
+                        metavar="path/to/cache",
+                        default=None)
+    PARSER.add_argument("--queue",
+                        help=("Add the urls to this download queue "
+                              "(created if needed) instead of downloading "
+                              "them, along with their options (password, "
+                              "filename, output directory,...)."),
+                        metavar="path/to/queue.db",
+                        default=None)
+    PARSER.add_argument("--daemon",
+                        help=("Download the recordings of the --queue, and "
+                              "wait for new ones, until interrupted. "
+                              "Interrupted downloads are resumed by the "
+                              "next daemon."),
+                        default=False,
+                        action='store_true')
+    PARSER.add_argument("--stats-file",
+                        help=("Append the wall time and bytes of every phase "
+                              "of the downloads (page fetch, parsing, "
+                              "transfer,...) to this file, as JSON lines."),
+                        metavar="path/to/stats.jsonl",
+                        default=None)
+    PARSER.add_argument("--metrics-port",
+                        help=("Serve live metrics (bytes downloaded, "
+                              "throughput, active streams, retries,...) "
+                              "in the Prometheus text format at "
+                              "http://127.0.0.1:port/metrics."),
+                        metavar="port",
+                        type=_check_positive,
+                        default=0)
     PARSER.add_argument("-v", "--log-level",
                         help=("Chose the level of verbosity. 0=debug, 1=info "
                               "(default), 2=warning 3=Error, 4=Critical, "
@@ -155,11 +397,13 @@ def parseOpts(args: List[str]):
 
     PARSER.add_argument("--save-chat",
                         help=("Save chat in the meeting as a plain-text "
-                              "file or .srt subtitle. "
+                              "file, a subtitle or JSON lines. "
                               "Specify mode as \"txt\" for plain-text, "
-                              "or \"srt\" for .srt subtitle"),
+                              "\"srt\" for .srt subtitle, \"vtt\" for "
+                              "WebVTT subtitle, or \"jsonl\" for JSON "
+                              "lines"),
                         metavar="mode",
-                        choices=["txt", "srt"],
+                        choices=FORMATS,
                         default=None)
     PARSER.add_argument("--chat-subtitle-dur",
                         help=("Duration in seconds that a chat message"
@@ -169,11 +413,13 @@ def parseOpts(args: List[str]):
                         default=3)
     PARSER.add_argument("--save-transcript",
                         help=("Save transcripts in the meeting as a "
-                              "plain-text file or .srt subtitle. Specify"
-                              " mode as \"txt\" for plain-text, "
-                              "or \"srt\" for .srt subtitle"),
+                              "plain-text file, a subtitle or JSON lines. "
+                              "Specify mode as \"txt\" for plain-text, "
+                              "\"srt\" for .srt subtitle, \"vtt\" for "
+                              "WebVTT subtitle, or \"jsonl\" for JSON "
+                              "lines"),
                         metavar="mode",
-                        choices=["txt", "srt"],
+                        choices=FORMATS,
                         default=None)
 
     PARSER.add_argument("--dump-pagemeta",
@@ -181,5 +427,26 @@ def parseOpts(args: List[str]):
                               " for further usages"),
                         default=False,
                         action='store_true')
+    PARSER.add_argument("--meta-store",
+                        help=("Append the page metas of the recordings to "
+                              "compressed JSON-lines files of this "
+                              "directory, with an index, instead of one "
+                              "json file each (see --dump-pagemeta)."),
+                        metavar="path/to/store",
+                        default=None)
+    PARSER.add_argument("--metadata-only",
+                        help=("Download nothing, but write one JSON line "
+                              "per recording to this file: topic, start "
+                              "time, clips, size of the videos, count of "
+                              "chat messages and transcript lines. '-' "
+                              "writes to the standard output."),
+                        metavar="path/to/inventory.jsonl",
+                        default=None)
 
-    return PARSER.parse_args(args)
+    args = PARSER.parse_args(args)
+    if args.url is None and args.batch_file is None and not args.daemon:
+        PARSER.error("one of the arguments -u/--url -a/--batch-file is "
+                     "required")
+    if args.daemon and args.queue is None:
+        PARSER.error("argument --daemon: requires --queue")
+    return args
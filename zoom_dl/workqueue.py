@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Define the persistent queue of recordings to download, see --daemon."""
+
+import os
+import json
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# seconds a job stays leased by a worker without being renewed
+LEASE_DURATION = 60
+# seconds between two looks at the queue, when idle
+POLL_INTERVAL = 5
+# times a recording is tried before being marked as failed
+MAX_ATTEMPTS = 3
+# options of the command line saved along a queued url
+JOB_OPTIONS = ("password", "filename", "filename_add_date", "output_dir",
+               "count_clips", "save_chat", "save_transcript",
+               "dump_pagemeta")
+
+
+class Job(NamedTuple):
+    """A recording leased from the queue."""
+
+    id: int
+    url: str
+    # options of the command line, see JOB_OPTIONS
+    options: dict
+    # count of times it was leased, this one included
+    attempts: int
+
+
+def job_options(args) -> dict:
+    """Return the options of args to queue along the urls."""
+    options = {name: getattr(args, name) for name in JOB_OPTIONS}
+    # the daemon may run from another directory
+    options["output_dir"] = os.path.abspath(args.output_dir or os.getcwd())
+    return options
+
+
+def _is_alive(pid: int) -> bool:
+    """Check whether the process pid of this host is still running."""
+    if os.name != "posix":
+        # can't tell, wait for its leases to expire
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DownloadQueue():
+    """Queue of recordings to download, stored in SQLite.
+
+    Urls are submitted by any process, even while a daemon is running, and
+    leased by the workers of the daemons, which renew their leases while
+    downloading. A job whose lease expired, or whose process died, goes
+    back in the queue: its download resumes from the partial files.
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) the queue stored at path."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.owner = "{}:{}".format(socket.gethostname(), os.getpid())
+        self._lock = threading.Lock()
+        # only readable by you, it holds the passwords of the recordings
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        os.chmod(path, 0o600)
+        self._db = sqlite3.connect(path, timeout=30,
+                                   check_same_thread=False)
+        with self._lock:
+            # submitting processes don't block the daemon
+            self._db.execute("PRAGMA journal_mode=WAL")
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id INTEGER PRIMARY KEY, url TEXT NOT NULL, "
+                    "options TEXT NOT NULL, state TEXT NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, "
+                    "lease_expires REAL, not_before REAL NOT NULL DEFAULT 0, "
+                    "error TEXT, created REAL, updated REAL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state "
+                                 "ON jobs (state, not_before)")
+
+    def submit(self, urls: Iterable[str], options: dict) -> int:
+        """Add urls to the queue, unless already waiting or in progress.
+
+        Returns:
+            int: count of urls added
+        """
+        added = 0
+        now = time.time()
+        with self._lock, self._db:
+            for url in urls:
+                if self._db.execute(
+                        "SELECT 1 FROM jobs WHERE url = ? AND state IN "
+                        "('queued', 'leased')", (url,)).fetchone():
+                    continue
+                self._db.execute(
+                    "INSERT INTO jobs (url, options, state, created, "
+                    "updated) VALUES (?, ?, 'queued', ?, ?)",
+                    (url, json.dumps(options), now, now))
+                added += 1
+        return added
+
+    def recover(self) -> int:
+        """Put back in the queue the jobs of dead processes of this host.
+
+        Jobs of other hosts go back once their lease expires.
+
+        Returns:
+            int: count of jobs put back
+        """
+        host = self.owner.rpartition(":")[0]
+        with self._lock:
+            owners = [owner for owner, in self._db.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE state = 'leased'")]
+        dead = [owner for owner in owners
+                if owner.rpartition(":")[0] == host and
+                not _is_alive(int(owner.rpartition(":")[2]))]
+        recovered = 0
+        with self._lock, self._db:
+            for owner in dead:
+                recovered += self._release(
+                    "owner = ?", (owner,), "Process {} died".format(owner))
+        return recovered
+
+    def _release(self, where: str, params: tuple, error: str) -> int:
+        """Put back in the queue the leased jobs matching where.
+
+        Jobs already tried MAX_ATTEMPTS times are marked as failed
+        instead, so that a recording crashing its process is given up.
+        Must be called in a transaction.
+
+        Returns:
+            int: count of jobs put back in the queue
+        """
+        now = time.time()
+        self._db.execute(
+            "UPDATE jobs SET state = 'failed', owner = NULL, error = ?, "
+            "updated = ? WHERE state = 'leased' AND attempts >= ? AND "
+            + where, (error, now, MAX_ATTEMPTS) + params)
+        return self._db.execute(
+            "UPDATE jobs SET state = 'queued', owner = NULL, error = ?, "
+            "updated = ? WHERE state = 'leased' AND " + where,
+            (error, now) + params).rowcount
+
+    def lease(self) -> Optional[Job]:
+        """Lease the next job ready to be downloaded, if any."""
+        now = time.time()
+        with self._lock, self._db:
+            # the process of expired leases likely died
+            self._release("lease_expires < ?", (now,), "Lease expired")
+            while True:
+                row = self._db.execute(
+                    "SELECT id, url, options, attempts FROM jobs "
+                    "WHERE state = 'queued' AND not_before <= ? "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                # another process may have leased it in the meantime
+                if self._db.execute(
+                        "UPDATE jobs SET state = 'leased', owner = ?, "
+                        "lease_expires = ?, attempts = attempts + 1, "
+                        "updated = ? WHERE id = ? AND state = 'queued'",
+                        (self.owner, now + LEASE_DURATION, now,
+                         row[0])).rowcount:
+                    return Job(row[0], row[1], json.loads(row[2]),
+                               row[3] + 1)
+
+    def renew(self, jobs: List[Job]):
+        """Extend the leases of jobs, still in progress."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND owner = ?",
+                [(now + LEASE_DURATION, job.id, self.owner) for job in jobs])
+
+    def complete(self, job: Job):
+        """Mark a job as done."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET state = 'done', owner = NULL, "
+                "error = NULL, updated = ? WHERE id = ?",
+                (time.time(), job.id))
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Put a failed job back in the queue, for a later try.
+
+        Returns:
+            bool: False if it was tried too many times, and marked as failed
+        """
+        now = time.time()
+        retry = job.attempts < MAX_ATTEMPTS
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, error = ?, "
+                "not_before = ?, updated = ? WHERE id = ?",
+                ("queued" if retry else "failed", error,
+                 now + 60 * job.attempts, now, job.id))
+        return retry
+
+    def counts(self) -> Dict[str, int]:
+        """Return the count of jobs by state."""
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def close(self):
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
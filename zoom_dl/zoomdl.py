@@ -1,18 +1,118 @@
 #!/usr/bin/env python3
 # coding: utf-8
 """Define the main ZoomDL class and its methods."""
+import argparse
+import contextlib
+import copy
+import hashlib
 import os
 import re
+import shlex
+import subprocess  # nosec
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                as_completed, wait)
+from urllib.parse import urlparse
 
-import demjson3
 import requests
-from tqdm import tqdm
-from typing import Optional
+from typing import Callable, Optional
 import datetime
 import json
 
-from .utils import ZoomdlCookieJar
+from .cache import MetadataCache, default_cache_dir
+from .connections import DEFAULT_POOL_SIZE, make_session
+from .cookies import SessionStore, ZoomdlCookieJar
+from .errors import (AuthenticationError, InvalidURLError, MetadataError,
+                     OutputExistsError, PageError, ZoomDLError)
+from .exporters import write_chat, write_transcript
+from .manifest import Manifest
+from .metastore import MetadataStore
+from .metrics import Metrics, serve_metrics
+from .stats import Stats, StatsFile
+from .transfer import (BLOCK_SIZE, EXPIRED_STATUS_CODES, NETWORK_ERRORS,
+                       DownloadError, TokenBucket, allocated_size,
+                       backoff_delay, check_free_space, copy_stream,
+                       get_validator, hash_file, load_segments,
+                       load_validator, parse_content_range, preallocate,
+                       response_total_size, save_segments, save_validator,
+                       split_ranges, write_checksum)
+from .utils import find_js_objects, js_to_json
+from .workqueue import POLL_INTERVAL, DownloadQueue, Job
+
+# serializes the videos streamed to stdout
+_STDOUT_LOCK = threading.Lock()
+# serializes the questions to the user, see confirm
+_CONFIRM_LOCK = threading.Lock()
+# seconds between two saves of the progress of a segmented download
+CHECKPOINT_INTERVAL = 2
+
+# prefixes of the JS objects injected in the pages
+DATA_REGEX = re.compile(r"window\.__data__\s*=\s*(?={)")
+CHAT_REGEX = re.compile(r"window\.__data__\.chatList\.push\(\s*(?={)")
+TRANSCRIPT_REGEX = re.compile(
+    r"window\.__data__\.transcriptList\.push\(\s*(?={)")
+
+
+class Recording():
+    """State of one recording (one url) being processed.
+
+    Each url of a batch gets its own Recording, so that several of them can
+    be processed concurrently by the same ZoomDL instance.
+    """
+
+    def __init__(self, url, filename_add_date=False):
+        """Init the recording, extracting domain and subdomain from url.
+
+        Raises:
+            IndexError: if the url is not a zoom url.
+        """
+        self.url = url
+        self.filename_add_date = filename_add_date
+        self.page = None
+        # url of the current page, after redirections
+        self.page_url = url
+        self.metadata = None
+        # key of the cache entry the metadata come from, if any
+        self.cache_key = None
+        # HTTP requests sent for this page (clip), see ZoomDL._request
+        self.request_count = 0
+        self._lock = threading.Lock()
+        # held while the page is fetched again, see _refresh_vid_url
+        self.refresh_lock = threading.Lock()
+        regex = r"(?:https?:\/\/)?([^.]*\.?)(zoom[^.]*\.(?:us|com))"
+        self.subdomain, self.domain = re.findall(regex, self.url)[0]
+
+    def count_requests(self, count: int = 1):
+        """Count HTTP requests sent for this recording."""
+        with self._lock:
+            self.request_count += count
+
+    @property
+    def headers(self):
+        """Return headers to send along every request of this recording."""
+        return {"referer": "https://{}{}/".format(self.subdomain,
+                                                  self.domain)}
+
+    @property
+    def recording_name(self):
+        """Return name of the current recording.
+
+        Raises:
+            MetadataError: if the metadata has no topic
+        """
+        name = (self.metadata.get("topic") or
+                self.metadata.get("r_meeting_topic"))
+        if not name:
+            raise MetadataError("No topic in the metadata")
+        name = name.replace(" ", "_")
+        if self.filename_add_date:
+            recording_start_time = datetime.datetime.fromtimestamp(
+                self.metadata["fileStartTime"] / 1000)
+            name = name + "_" + recording_start_time.strftime("%Y-%m-%d")
+        return name
 
 
 class ZoomDL():
@@ -22,28 +122,117 @@ class ZoomDL():
         """Init the class."""
         self.args = args
         self.loglevel = args.log_level
-        self.page = None
-        self.url, self.domain, self.subdomain = "", "", ""
-        self.metadata = None
-        self.session = requests.session()
+        # one pool for every worker, big enough for all their connections
+        # (videos of a clip, and of clips ahead, are downloaded at the same
+        # time)
+        pool_size = (self.args.pool_size or
+                     max(DEFAULT_POOL_SIZE,
+                         self.args.jobs * self.args.connections * 2 *
+                         (self.args.clip_lookahead + 1)))
+        self.session = make_session(pool_size, self.args.tcp_keepalive,
+                                    self.args.recv_buffer)
+        self.connections = self.session.get_adapter("https://").metrics
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self._manifests = {}
+        self._manifests_lock = threading.Lock()
+
+        # rate limits, shared by every download and page request
+        rates = [rate for rate in (self.args.limit_rate,
+                                   self.args.limit_rate_per_connection)
+                 if rate]
+        # smaller blocks when limited, for a smoother rate
+        self._block_size = (max(16 * 1024, min(BLOCK_SIZE, min(rates) // 8))
+                            if rates else BLOCK_SIZE)
+        self._rate_limit = None
+        if self.args.limit_rate:
+            self._rate_limit = TokenBucket(self.args.limit_rate,
+                                           self._block_size)
+        self._page_limit = None
+        if self.args.page_rate:
+            self._page_limit = TokenBucket(self.args.page_rate, 1)
 
         self.loglevel = self.args.log_level
 
+        if self.args.user_agent is None:
+            self._print("Using standard Windows UA", 0)
+            # somehow standard User-Agent
+            ua = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/74.0.3729.169 Safari/537.36")
+        else:
+            ua = self.args.user_agent
+            self._print("Using custom UA: " + ua, 0)
+        self.session.headers.update({
+            "User-Agent": ua
+        })
+
         if self.args.cookies:
             cookiejar = ZoomdlCookieJar(self.args.cookies)
             cookiejar.load()
             self.session.cookies.update(cookiejar)
 
-    @property
-    def recording_name(self):
-        """Return name of the current recording."""
-        name = (self.metadata.get("topic") or
-                self.metadata.get("r_meeting_topic")).replace(" ", "_")
-        if self.args.filename_add_date:
-            recording_start_time = datetime.datetime.fromtimestamp(
-                self.metadata["fileStartTime"] / 1000)
-            name = name + "_" + recording_start_time.strftime("%Y-%m-%d")
-        return name
+        # instrumentation of the phases, see Stats.add_hook to get events
+        self.stats = Stats()
+        self._stats_file = None
+        if self.args.stats_file:
+            self._stats_file = StatsFile(self.args.stats_file)
+            self.stats.add_hook(self._stats_file)
+
+        # live metrics, see --metrics-port
+        self.metrics = None
+        if self.args.metrics_port:
+            self.metrics = Metrics()
+            self.stats.add_hook(self.metrics)
+            serve_metrics(self.metrics, self.args.metrics_port)
+            self._print("Serving metrics at http://127.0.0.1:{}/metrics"
+                        .format(self.args.metrics_port), 0)
+
+        # cookies of validated passwords, see SessionStore
+        self.sessions = None
+        if self.args.session_ttl > 0:
+            self.sessions = SessionStore(
+                self.args.cache_dir or default_cache_dir(),
+                self.args.session_ttl)
+            self.sessions.restore(self.session.cookies)
+
+        # archive of the metadata, see --meta-store
+        self.meta_store = None
+        if self.args.meta_store:
+            self.meta_store = MetadataStore(self.args.meta_store)
+
+        self.cache = None
+        if self.args.cache_ttl > 0:
+            self.cache = MetadataCache(
+                self.args.cache_dir or default_cache_dir(),
+                self.args.cache_ttl)
+
+        # whether to erase existing files, None to ask the user
+        self.overwrite = None
+        # paths of the files completely downloaded
+        self.files = []
+
+    def with_options(self, **options) -> "ZoomDL":
+        """Return a ZoomDL with some options changed, sharing this one's state.
+
+        The session (and its connection pool), rate limits, caches and
+        stats are shared, so that both can be used at the same time.
+        `files` is not shared.
+
+        Args:
+            options: options of the command line, by their long names
+                (e.g. password="secret", output_dir="/tmp")
+        """
+        args = vars(self.args).copy()
+        for key, value in options.items():
+            if key not in args:
+                raise TypeError("Unknown option: {}".format(key))
+            args[key] = value
+        other = copy.copy(self)
+        other.args = argparse.Namespace(**args)
+        other.loglevel = other.args.log_level
+        other.files = []
+        return other
 
     def _print(self, message, level=0):
         """Print to console, if level is sufficient.
@@ -67,49 +256,206 @@ class ZoomDL():
             Defaults to 2.
         """
         if level < 5 and level >= self.loglevel:
-            print(message)
+            # stdout may be taken by the videos, see `-f -`
+            print(message, file=(sys.stderr if "-" in (
+                self.args.filename, self.args.metadata_only) else sys.stdout))
+
+    def _request(self, rec: Recording, method, url,
+                 **kwargs) -> requests.Response:
+        """Send a request of the recording, counting it.
+
+        Redirections followed count as requests too. Failed requests are
+        counted in the metrics, by kind (page, head or video) and status.
 
-    def _change_page(self, url):
-        """Change page, with side methods."""
+        Raises:
+            PageError: on a network error while loading a page (errors of
+                videos are left to _retry_transfer)
+        """
+        rec.count_requests()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except NETWORK_ERRORS as exc:
+            kind = self._count_failure(method, kwargs)
+            if kind != "page":
+                raise
+            self._print("Error loading {}: {}".format(url, exc), 3)
+            raise PageError(str(exc)) from exc
+        rec.count_requests(len(response.history))
+        # 416 tells that a partial file is complete, see _transfer
+        if response.status_code >= 400 and response.status_code != 416:
+            self._count_failure(method, kwargs, response.status_code)
+        return response
+
+    def _count_failure(self, method, kwargs, status_code=None) -> str:
+        kind = ("head" if method == "HEAD" else
+                "video" if kwargs.get("stream") else "page")
+        if self.metrics is not None:
+            self.metrics.count_failure(kind, status_code)
+        return kind
+
+    def _change_page(self, rec: Recording, url):
+        """Change page of the recording, with side methods."""
         self._print("Changing page to {}".format(url), 0)
-        self.page = self.session.get(url)
+        self._wait_page_slot()
+        with self.stats.phase("page", rec.url, page_url=url) as event:
+            rec.page = self._request(rec, "GET", url, headers=rec.headers)
+            event["bytes"] = len(rec.page.content)
+            event["status"] = rec.page.status_code
+        rec.page_url = rec.page.url
         # self.check_captcha()
 
-    def get_page_meta(self) -> Optional[dict]:
-        """Retrieve metadata from the current self.page.
+    def _load_page(self, rec: Recording, url, authenticate=False):
+        """Load the page at url and its metadata in the recording.
+
+        If the page is in the cache, neither fetch nor parse it (nor
+        authenticate). Pages already showing the recording, thanks to the
+        cookies of a previous authentication, don't need it either.
+        """
+        if self.cache is not None:
+            cached = self.cache.get_page(url)
+            if cached is not None:
+                self._print("Using cached metadata for {}".format(url), 0)
+                rec.page_url = cached["page_url"]
+                rec.metadata = cached["metadata"]
+                rec.cache_key = url
+                return
+        self._change_page(rec, url)
+        if authenticate and not DATA_REGEX.search(rec.page.text):
+            self.authenticate(rec)
+            if self.sessions is not None:
+                self.sessions.save(self.session.cookies, rec.domain)
+        elif authenticate:
+            self._print("Already authenticated", 0)
+        rec.metadata = self._parse_page(rec)
+        rec.cache_key = None
+        if self.cache is not None and rec.metadata is not None:
+            self.cache.put_page(url, rec.page_url, rec.metadata)
+
+    def _wait_page_slot(self):
+        """Wait until a request to the web pages is allowed by --page-rate.
+        """
+        if self._page_limit is not None:
+            self._page_limit.consume()
+
+    def _throttle(self) -> Optional[Callable[[int], None]]:
+        """Return the throttle of a new connection, see copy_stream.
+
+        It consumes from the global bucket and from a bucket of its own,
+        and counts the bytes in the metrics.
+        """
+        buckets = []
+        if self._rate_limit is not None:
+            buckets.append(self._rate_limit)
+        if self.args.limit_rate_per_connection:
+            buckets.append(TokenBucket(self.args.limit_rate_per_connection,
+                                       self._block_size))
+        if not buckets and self.metrics is None:
+            return None
+        metrics = self.metrics
+
+        def throttle(size):
+            for bucket in buckets:
+                bucket.consume(size)
+            if metrics is not None:
+                metrics.count_bytes(size)
+        return throttle
+
+    def _parse_page(self, rec: Recording) -> Optional[dict]:
+        """Return the metadata of the current page, see get_page_meta."""
+        with self.stats.phase("parse", rec.url,
+                              bytes=len(rec.page.content)) as event:
+            metadata = self.get_page_meta(rec)
+            if metadata is not None:
+                event["clip"] = metadata.get("currentClip")
+        return metadata
+
+    def _invalidate_cache(self, rec: Recording, vid_url):
+        """Forget the cached data that led to a failed download."""
+        if self.cache is None:
+            return
+        self.cache.invalidate(vid_url)
+        if rec.cache_key is not None:
+            self.cache.invalidate(rec.cache_key)
+
+    def _host_slot(self, url) -> threading.BoundedSemaphore:
+        """Return the semaphore bounding simultaneous downloads to url's host.
+        """
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.args.max_per_host)
+            return self._host_slots[host]
+
+    def _manifest(self, filepath) -> Manifest:
+        """Return the manifest of the directory of filepath."""
+        directory = os.path.dirname(filepath)
+        with self._manifests_lock:
+            if directory not in self._manifests:
+                self._manifests[directory] = Manifest(directory)
+            return self._manifests[directory]
+
+    def _get_filepath(self, rec: Recording, fname, extension,
+                      clip: int = None, appendix: str = "") -> str:
+        """Return the path of a file of the recording, see get_filepath."""
+        return get_filepath(fname, rec.recording_name, extension, clip,
+                            appendix, self.args.output_dir, self.overwrite)
+
+    def _is_complete(self, rec: Recording, stream, fname, extension,
+                     clip: int = None, appendix: str = "") -> bool:
+        """Check in the manifest whether a file was already downloaded."""
+        if not self.args.manifest:
+            return False
+        filepath = make_filepath(fname, rec.recording_name, extension, clip,
+                                 appendix, self.args.output_dir)
+        if self._manifest(filepath).is_complete(rec.url, clip, stream,
+                                                filepath):
+            self._print("'{}' was already downloaded, skipping".format(
+                filepath), 1)
+            return True
+        return False
+
+    def _mark_complete(self, rec: Recording, stream, clip, filepath,
+                       checksum: Optional[str] = None):
+        """Record a completely downloaded file, in the manifest if any."""
+        self.files.append(filepath)
+        if self.args.manifest:
+            self._manifest(filepath).add(rec.url, clip, stream, filepath,
+                                         checksum)
+
+    def get_page_meta(self, rec: Recording) -> Optional[dict]:
+        """Retrieve metadata from the current page of the recording.
 
         Returns:
             dict: dictionary of all relevant metadata
         """
         # default case
-        text = self.page.text
+        text = rec.page.text
         meta = dict(re.findall(r'type="hidden" id="([^"]*)" value="([^"]*)"',
                                text))
         # if javascript was correctly loaded, look for injected metadata
-        meta2_match = re.search("window.__data__ = ({(?:.*\n)*});",
-                                self.page.text)
-        if meta2_match is not None:
-            try:
-                meta2 = demjson3.decode(meta2_match.group(1))
-            except demjson3.JSONDecodeError:
-                self._print("[WARNING] Error with the meta parsing. This "
-                            "should not be critical. Please contact a dev.", 2)
-            meta.update(meta2)
+        meta2_match = find_js_objects(text, DATA_REGEX)
+        if len(meta2_match) > 0:
+            for matched_json in meta2_match:
+                try:
+                    meta.update(decode_js_object(matched_json))
+                except ValueError:
+                    self._print("[WARNING] Error with the meta parsing. This "
+                                "should not be critical. "
+                                "Please contact a dev.", 2)
         else:
             self._print("Advanced meta failed", 2)
             # self._print(self.page.text)
 
         # look for injected chat messages
         chats = []
-        chat_match = re.findall(
-            r"window.__data__.chatList.push\(\s*?({(?:.*\n)*?})\s*?\)",
-            self.page.text)
+        chat_match = find_js_objects(text, CHAT_REGEX)
         if len(chat_match) > 0:
             for matched_json in chat_match:
                 try:
-                    message = demjson3.decode(matched_json)
+                    message = decode_js_object(matched_json)
                     chats.append(message)
-                except demjson3.JSONDecodeError:
+                except ValueError:
                     self._print("[WARNING] Error with the meta parsing. This "
                                 "should not be critical. "
                                 "Please contact a dev.", 2)
@@ -119,15 +465,13 @@ class ZoomDL():
 
         # look for injected transcripts
         transcripts = []
-        transcript_match = re.findall(
-            r"window.__data__.transcriptList.push\(\s*?({(?:.*\n)*?})\s*?\)",
-            self.page.text)
+        transcript_match = find_js_objects(text, TRANSCRIPT_REGEX)
         if len(transcript_match) > 0:
             for matched_json in transcript_match:
                 try:
-                    message = demjson3.decode(matched_json)
+                    message = decode_js_object(matched_json)
                     transcripts.append(message)
-                except demjson3.JSONDecodeError:
+                except ValueError:
                     self._print("[WARNING] Error with the meta parsing. This "
                                 "should not be critical. "
                                 "Please contact a dev.", 2)
@@ -154,228 +498,1061 @@ class ZoomDL():
             meta["url"] = vid_url_match.group(1)
         return meta
 
-    def dump_page_meta(self, fname, clip: int = None):
+    def dump_page_meta(self, rec: Recording, fname, clip: int = None):
         """
         Dump page meta in json format to fname.
+
+        With --meta-store, it is appended to the store instead.
         """
+        if self.meta_store is not None:
+            with self.stats.phase("meta", rec.url, clip) as event:
+                event["bytes"] = self.meta_store.append(rec.url, clip,
+                                                        rec.metadata)
+            self._print("Stored page meta in '{}'.".format(
+                self.args.meta_store), 1)
+            return
+        if self._is_complete(rec, "meta", fname, "json", clip):
+            return
         self._print("Dumping page meta...", 0)
-        filepath = get_filepath(fname, self.recording_name, "json", clip)
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f)
+        filepath = self._get_filepath(rec, fname, "json", clip)
+        with self.stats.phase("meta", rec.url, clip) as event:
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(rec.metadata, f)
+            event["bytes"] = os.path.getsize(filepath)
         self._print(f"Dumped page meta to '{filepath}'.", 1)
+        self._mark_complete(rec, "meta", clip, filepath)
 
-    def download_vid(self, fname, clip: int = None):
+    def download_vid(self, rec: Recording, fname, clip: int = None):
         """Download one recording and save it at fname.
 
         Including videos, chat, and transcripts
         """
         self._print("Downloading filename {}, clip={}".format(
             fname, str(clip)), 0)
-        all_urls = {
-            "camera": self.metadata.get("viewMp4Url"),
-            "screen": self.metadata.get("shareMp4Url"),
-            # the link below is rarely valid
-            # (only when both the two links above are invalid)
-            "unknown": self.metadata.get("url"),
-        }
-        for key, url in all_urls.copy().items():
-            if url is None or url == "":
-                all_urls.pop(key)
+        all_urls = get_stream_urls(rec.metadata)
         if len(all_urls) > 1:
             self._print((f"Found {len(all_urls)} screens, "
                          "downloading all of them"),
                         1)
             self._print(all_urls, 0)
 
+        # videos streamed to stdout or a command aren't saved
+        piped = self.args.filename == "-" or self.args.output_pipe is not None
+        if self.args.filename == "-" and len(all_urls) > 1:
+            self._print("Found {} videos, only one can be streamed to the "
+                        "standard output".format(len(all_urls)), 4)
+            raise DownloadError("Several videos can't be streamed to the "
+                                "standard output, use --output-pipe",
+                                retryable=False)
+        streams = []
         for vid_name, vid_url in all_urls.items():
             extension = vid_url.split("?")[0].split("/")[-1].split(".")[1]
             self._print("Found name is {}, vid_name is {}, extension is {}"
-                        .format(self.recording_name, vid_name, extension), 0)
+                        .format(rec.recording_name, vid_name, extension), 0)
             vid_name_appendix = f"_{vid_name}" if len(all_urls) > 1 else ""
-            filepath = get_filepath(
-                fname, self.recording_name, extension, clip, vid_name_appendix)
-            filepath_tmp = filepath + ".part"
-            self._print("Full filepath is {}, temporary is {}".format(
-                filepath, filepath_tmp), 0)
-            self._print("Downloading '{}'...".format(
-                filepath.split("/")[-1]), 1)
-            vid_header = self.session.head(vid_url)
-            total_size = int(vid_header.headers.get('content-length'))
-            # unit_int, unit_str = ((1024, "KiB") if total_size < 30*1024**2
-            #                       else (1024**2, "MiB"))
-            start_bytes = int(os.path.exists(filepath_tmp) and
-                              os.path.getsize(filepath_tmp))
-            if start_bytes > 0:
-                self._print("Incomplete file found ({:.2f}%), resuming..."
-                            .format(100*start_bytes/total_size), 1)
-            headers = {"Range": "bytes={}-".format(start_bytes)}
-            vid = self.session.get(vid_url, headers=headers, stream=True)
-            if vid.status_code in [200, 206] and total_size > 0:
-                with open(filepath_tmp, "ab") as vid_file:
-                    with tqdm(total=total_size,
-                              unit='B',
-                              initial=start_bytes,
-                              dynamic_ncols=True,
-                              unit_scale=True,
-                              unit_divisor=1024) as pbar:
-                        for data in vid.iter_content(1024):
-                            if data:
-                                pbar.update(len(data))
-                                vid_file.write(data)
-                                vid_file.flush()
-                self._print("Done!", 1)
-                os.rename(filepath_tmp, filepath)
+            if piped:
+                filepath = make_filepath(fname, rec.recording_name,
+                                         extension, clip, vid_name_appendix,
+                                         self.args.output_dir)
+            elif self._is_complete(rec, vid_name, fname, extension, clip,
+                                   vid_name_appendix):
+                continue
             else:
-                self._print(
-                    "Woops, error downloading: '{}'".format(vid_url), 3)
-                self._print("Status code: {}, file size: {}".format(
-                    vid.status_code, total_size), 0)
-                sys.exit(1)
+                filepath = self._get_filepath(
+                    rec, fname, extension, clip, vid_name_appendix)
+            streams.append((vid_name, vid_url, filepath))
+
+        # streams are independent files, download them at the same time
+        def download_stream(vid_name, vid_url, filepath):
+            with self._host_slot(vid_url), (
+                    self.metrics.stream() if self.metrics is not None
+                    else contextlib.nullcontext()):
+                return (self._pipe_stream if piped else
+                        self._download_stream)(rec, vid_name, vid_url,
+                                               filepath, clip)
+
+        error = None
+        with ThreadPoolExecutor(max(1, len(streams))) as pool:
+            futures = {pool.submit(download_stream, vid_name, vid_url,
+                                   filepath):
+                       (vid_name, filepath)
+                       for vid_name, vid_url, filepath in streams}
+            for future in as_completed(futures):
+                vid_name, filepath = futures[future]
+                try:
+                    checksum = future.result()
+                except (ZoomDLError, SystemExit) as exc:
+                    error = exc
+                    continue
+                if not piped:
+                    self._mark_complete(rec, vid_name, clip, filepath,
+                                        checksum)
+        if error is not None:
+            raise error
 
         # save chat
         if self.args.save_chat is not None:
-            messages = self.metadata["chatList"]
+            messages = rec.metadata["chatList"]
             if len(messages) == 0:
                 self._print(f"Unable to retrieve chat message from url"
-                            f" {self.url} (is there no chat message?)", 2)
+                            f" {rec.url} (is there no chat message?)", 2)
+            elif self._is_complete(rec, "chat", fname, self.args.save_chat,
+                                   clip, ".chat"):
+                pass
             else:
-                # Convert time string to proper format
-                for message in messages:
-                    message["time"] = shift_time_delta(message["time"])
-
-                if self.args.save_chat == "txt":
-                    chat_filepath = get_filepath(
-                        fname, self.recording_name, "txt", clip, ".chat")
-                    with open(chat_filepath, "w", encoding="utf-8") as outfile:
-                        for idx, message in enumerate(messages):
-                            outfile.write("[{}] @ {} :\n".format(
-                                message["username"], message["time"]))
-                            outfile.write(message["content"] + "\n")
-                            if idx + 1 < len(messages):
-                                outfile.write("\n")
-                elif self.args.save_chat == "srt":
-                    chat_filepath = get_filepath(
-                        fname, self.recording_name, "srt", clip, ".chat")
-                    with open(chat_filepath, "w", encoding="utf-8") as outfile:
-                        for idx, message in enumerate(messages):
-                            end_time = shift_time_delta(
-                                message["time"], self.args.chat_subtitle_dur)
-                            outfile.write(str(idx+1) + "\n")
-                            outfile.write(
-                                f"{message['time']},000 --> {end_time},000\n")
-                            outfile.write(message["username"] +
-                                          ": " + message["content"] + "\n")
-                            if idx + 1 < len(messages):
-                                outfile.write("\n")
+                with self.stats.phase("chat", rec.url, clip) as event:
+                    chat_filepath = self._write_chat(rec, messages, fname,
+                                                     clip)
+                    event["bytes"] = os.path.getsize(chat_filepath)
                 self._print(
                     f"Successfully saved chat into '{chat_filepath}'!", 1)
+                self._mark_complete(rec, "chat", clip, chat_filepath)
 
         # save transcripts
         if self.args.save_transcript is not None:
-            transcripts = self.metadata["transcriptList"]
+            transcripts = rec.metadata["transcriptList"]
             if len(transcripts) == 0:
                 self._print("Unable to retrieve transcript from url"
-                            f"{self.url} (is transcript not enabled "
+                            f"{rec.url} (is transcript not enabled "
                             "in this video?)", 2)
+            elif self._is_complete(rec, "transcript", fname,
+                                   self.args.save_transcript, clip,
+                                   ".transcript"):
+                pass
             else:
-                if self.args.save_transcript == "txt":
-                    tran_filepath: str = get_filepath(fname,
-                                                      self.recording_name,
-                                                      "txt",
-                                                      clip,
-                                                      ".transcript")
-                    with open(tran_filepath, "w", encoding="utf-8") as outfile:
-                        for idx, transcript in enumerate(transcripts):
-                            outfile.write("[{}] @ {} --> {} :\n".format(
-                                transcript["username"],
-                                transcript["ts"],
-                                transcript["endTs"]))
-                            outfile.write(transcript["text"] + "\n")
-                            if idx + 1 < len(transcripts):
-                                outfile.write("\n")
-                elif self.args.save_transcript == "srt":
-                    tran_filepath = get_filepath(
-                        fname, self.recording_name, "srt", clip, ".transcript")
-                    with open(tran_filepath, "w", encoding="utf-8") as outfile:
-                        for idx, transcript in enumerate(transcripts):
-                            outfile.write(str(idx+1) + "\n")
-                            outfile.write("{} --> {}\n".format(
-                                transcript["ts"].replace(".", ","),
-                                transcript["endTs"].replace(".", ",")))
-                            outfile.write(transcript["username"] +
-                                          ": " +
-                                          transcript["text"] +
-                                          "\n")
-                            if idx + 1 < len(transcripts):
-                                outfile.write("\n")
+                with self.stats.phase("transcript", rec.url, clip) as event:
+                    tran_filepath = self._write_transcript(rec, transcripts,
+                                                           fname, clip)
+                    event["bytes"] = os.path.getsize(tran_filepath)
                 self._print("Successfully saved transcripts "
                             f"into '{tran_filepath}'!", 1)
+                self._mark_complete(rec, "transcript", clip, tran_filepath)
+        self._print("{} HTTP requests sent for {}{}".format(
+            rec.request_count, rec.url,
+            "" if clip is None else " (clip {})".format(clip)), 0)
 
-    def download(self, all_urls):
-        """Exposed class to download a list of urls."""
-        for url in all_urls:
-            self.url = url
+    def _write_chat(self, rec: Recording, messages, fname,
+                    clip: int = None) -> str:
+        """Write the chat messages in the format of --save-chat.
+
+        Returns:
+            str: path of the written file
+        """
+        chat_filepath = self._get_filepath(rec, fname, self.args.save_chat,
+                                           clip, ".chat")
+        write_chat(messages, chat_filepath, self.args.save_chat,
+                   self.args.chat_subtitle_dur)
+        return chat_filepath
+
+    def _write_transcript(self, rec: Recording, transcripts, fname,
+                          clip: int = None) -> str:
+        """Write the transcripts in the format of --save-transcript.
+
+        Returns:
+            str: path of the written file
+        """
+        tran_filepath = self._get_filepath(rec, fname,
+                                           self.args.save_transcript, clip,
+                                           ".transcript")
+        write_transcript(transcripts, tran_filepath,
+                         self.args.save_transcript)
+        return tran_filepath
+
+    def _download_stream(self, rec: Recording, vid_name, vid_url, filepath,
+                         clip: int = None) -> Optional[str]:
+        """Download one video stream of the recording to filepath.
+
+        Failed transfers are retried, see _retry_transfer, resuming from
+        what was already downloaded.
+
+        Returns:
+            str: SHA-256 checksum of the video, computed while downloading
+            it, if needed by --checksum or --manifest
+        """
+        filepath_tmp = filepath + ".part"
+        self._print("Full filepath is {}, temporary is {}".format(
+            filepath, filepath_tmp), 0)
+        self._print("Downloading '{}'...".format(
+            filepath.split("/")[-1]), 1)
+        digest = None
+
+        def transfer(vid_url):
+            nonlocal digest
+            digest = (hashlib.sha256()
+                      if self.args.checksum or self.args.manifest else None)
+            return self._transfer(rec, vid_url, filepath_tmp, clip, vid_name,
+                                  digest)
+
+        self._retry_transfer(rec, vid_name, vid_url, filepath, clip, transfer)
+        self._print("Done!", 1)
+        with self.stats.phase("rename", rec.url, clip, stream=vid_name):
+            os.rename(filepath_tmp, filepath)
+        if os.path.exists(filepath_tmp + ".validator"):
+            os.remove(filepath_tmp + ".validator")
+        if digest is None:
+            return None
+        checksum = digest.hexdigest()
+        if self.args.checksum:
+            write_checksum(filepath, checksum)
+        return checksum
+
+    def _retry_transfer(self, rec: Recording, vid_name, vid_url, filepath,
+                        clip: int, transfer: Callable[[str], int]):
+        """Call transfer with the video url until it succeeds.
+
+        Failed transfers are retried up to `args.retries` times. If the video
+        url seems to have expired, a fresh one is taken from the page.
+
+        Raises:
+            DownloadError: if the last try failed
+        """
+        attempt = 0
+        while True:
             try:
-                regex = r"(?:https?:\/\/)?([^.]*\.?)(zoom[^.]*\.(?:us|com))"
-                self.subdomain, self.domain = re.findall(regex, self.url)[0]
-            except IndexError:
-                self._print("Unable to extract domain and subdomain "
-                            "from url {}, exitting".format(self.url), 4)
-                sys.exit(1)
-            self.session.headers.update({
-                # set referer
-                'referer': "https://{}{}/".format(self.subdomain,
-                                                  self.domain),
-            })
-            if self.args.user_agent is None:
-                self._print("Using standard Windows UA", 0)
-                # somehow standard User-Agent
-                ua = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                      "AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/74.0.3729.169 Safari/537.36")
-            else:
-                ua = self.args.user_agent
-                self._print("Using custom UA: " + ua, 0)
-
-            self.session.headers.update({
-                "User-Agent": ua
-            })
-            self._change_page(url)
-            if self.args.password is not None:
-                self.authenticate()
-            self.metadata = self.get_page_meta()
-            if self.metadata is None:
-                self._print("Unable to find metadata, aborting.", 4)
+                with self.stats.phase("transfer", rec.url, clip,
+                                      stream=vid_name, path=filepath,
+                                      attempt=attempt) as event:
+                    event["bytes"] = transfer(vid_url)
+                return
+            except NETWORK_ERRORS as exc:
+                error = DownloadError(str(exc))
+            except DownloadError as exc:
+                error = exc
+            if attempt >= self.args.retries or not error.retryable:
+                self._print(
+                    "Woops, error downloading: '{}'".format(vid_url), 3)
+                self._print(error, 3)
+                self._invalidate_cache(rec, vid_url)
+                raise error
+            if error.status_code in EXPIRED_STATUS_CODES:
+                vid_url = (self._refresh_vid_url(rec, vid_name, vid_url) or
+                           vid_url)
+            delay = backoff_delay(attempt, error.retry_after)
+            attempt += 1
+            self._print("Error downloading '{}' ({}), retrying in {:.1f}s "
+                        "({}/{})".format(os.path.basename(filepath), error,
+                                         delay, attempt, self.args.retries),
+                        2)
+            time.sleep(delay)
+
+    def _pipe_stream(self, rec: Recording, vid_name, vid_url, filepath,
+                     clip: int = None) -> Optional[str]:
+        """Stream one video of the recording to stdout or `--output-pipe`.
+
+        Nothing is written to disk, filepath only names the video: its
+        checksum, if --checksum, is printed instead of saved next to a
+        video that doesn't exist. Failed transfers are retried, see
+        _retry_transfer, resuming after what was already sent.
+
+        Returns:
+            str: SHA-256 checksum of the video, if --checksum
+        """
+        self._print("Streaming '{}'...".format(os.path.basename(filepath)),
+                    1)
+        digest = hashlib.sha256() if self.args.checksum else None
+        # bytes sent so far, and validator of the video they come from
+        state = {"sent": 0, "validator": None}
+
+        def transfer(vid_url):
+            return self._pipe_transfer(rec, vid_url, sink, filepath, state,
+                                       digest)
+
+        with self._open_pipe(filepath) as sink:
+            self._retry_transfer(rec, vid_name, vid_url, filepath, clip,
+                                 transfer)
+        self._print("Done!", 1)
+        if digest is None:
+            return None
+        checksum = digest.hexdigest()
+        self._print("SHA-256 of '{}': {}".format(
+            os.path.basename(filepath), checksum), 1)
+        return checksum
+
+    def _pipe_transfer(self, rec: Recording, vid_url, sink, filepath,
+                       state: dict, digest=None) -> int:
+        """Try once to stream vid_url to sink, after the bytes already sent.
+
+        The size of the video is taken from the response, without a HEAD
+        request.
+
+        Args:
+            state (dict): "sent" bytes, updated while streaming, and
+                "validator" of the video, set by the first try
+
+        Returns:
+            int: count of bytes sent by this try
+
+        Raises:
+            DownloadError: if the transfer failed or is incomplete
+        """
+        start_bytes = state["sent"]
+        headers = dict(rec.headers)
+        if start_bytes:
+            headers["Range"] = "bytes={}-".format(start_bytes)
+            if state["validator"] is not None:
+                headers["If-Range"] = state["validator"]
+        vid = self._request(rec, "GET", vid_url, headers=headers,
+                            stream=True, timeout=self.args.timeout)
+        if vid.status_code != (206 if start_bytes else 200):
+            vid.close()
+            if vid.status_code == 200:
+                # what was already sent can't be taken back
+                raise DownloadError("Remote file changed during the "
+                                    "download, or can't be resumed",
+                                    retryable=False)
+            raise DownloadError.from_response(vid)
+        total_size = response_total_size(vid)
+        if total_size <= 0:
+            vid.close()
+            raise DownloadError("Invalid file size: {}".format(total_size),
+                                retryable=False)
+        if not start_bytes:
+            state["validator"] = get_validator(vid.headers)
+        with self._progress_bar(filepath, total_size, start_bytes) as pbar:
+
+            def on_block(size):
+                state["sent"] += size
+                pbar.update(size)
+
+            try:
+                written = copy_stream(vid, sink, on_block,
+                                      throttle=self._throttle(),
+                                      block_size=self._block_size,
+                                      digest=digest)
+            except BrokenPipeError as exc:
+                raise DownloadError("Output closed before the end of the "
+                                    "video: {}".format(exc),
+                                    retryable=False)
+            finally:
+                vid.close()
+        if start_bytes + written != total_size:
+            raise DownloadError("Incomplete download ({} of {} bytes)"
+                                .format(start_bytes + written, total_size))
+        return written
+
+    @contextlib.contextmanager
+    def _open_pipe(self, filepath):
+        """Open where to stream a video, see _pipe_stream.
+
+        The video is written to stdout, if only one. Otherwise, the command
+        of `--output-pipe` is run for every video, `{}` replaced by
+        filepath, and the video is written to its standard input.
+
+        Raises:
+            DownloadError: if the command failed
+        """
+        if self.args.output_pipe is None:
+            with _STDOUT_LOCK:
+                yield sys.stdout.buffer
+                sys.stdout.buffer.flush()
+            return
+        command = self.args.output_pipe.replace("{}", shlex.quote(filepath))
+        self._print("Running '{}'".format(command), 0)
+        process = subprocess.Popen(command, shell=True,  # nosec
+                                   stdin=subprocess.PIPE)
+        try:
+            yield process.stdin
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = process.wait()
+        if returncode != 0:
+            error = DownloadError("'{}' exited with status {}".format(
+                command, returncode), retryable=False)
+            self._print(error, 3)
+            raise error
+
+    def _transfer(self, rec: Recording, vid_url, filepath_tmp,
+                  clip: int = None, stream: str = None, digest=None) -> int:
+        """Try once to download vid_url to filepath_tmp, resuming it.
+
+        A partial download is only resumed if the remote file didn't change
+        since it started, according to its ETag or Last-Modified date, sent
+        in If-Range. Segmented downloads need the size of the file first,
+        from a HEAD request; otherwise the response to the GET request
+        gives it.
+
+        Args:
+            digest (hashlib hash, optional): updated with the whole file
+
+        Returns:
+            int: count of bytes downloaded by this try
+
+        Raises:
+            DownloadError: if the download failed or is incomplete
+        """
+        segmented = os.path.exists(filepath_tmp + ".segments")
+        if (segmented or self.args.connections > 1 or
+                self.args.preallocate):
+            vid_header = self._head(rec, vid_url, clip, stream)
+            segmented = (segmented or
+                         vid_header.get("accept-ranges") == "bytes")
+        if segmented:
+            total_size = int(vid_header.get('content-length') or 0)
+            if total_size <= 0:
+                raise DownloadError("Invalid file size: {}".format(
+                    total_size), retryable=False)
+            validator = get_validator(vid_header)
+            saved_validator = load_validator(filepath_tmp + ".validator")
+            if validator is not None and validator != saved_validator:
+                if saved_validator is not None:
+                    self._print("Remote file changed since the download "
+                                "started, restarting download", 2)
+                    for path in (filepath_tmp, filepath_tmp + ".segments"):
+                        if os.path.exists(path):
+                            os.remove(path)
+                save_validator(filepath_tmp + ".validator", validator)
+            check_free_space(filepath_tmp,
+                             total_size - allocated_size(filepath_tmp))
+            written = self._download_segmented(rec, vid_url, filepath_tmp,
+                                               total_size, validator)
+            if digest is not None:
+                # ranges were written out of order
+                hash_file(filepath_tmp, digest)
+            return written
+
+        # sent again at most once, after removing a too large file
+        while True:
+            start_bytes = int(os.path.exists(filepath_tmp) and
+                              os.path.getsize(filepath_tmp))
+            saved_validator = load_validator(filepath_tmp + ".validator")
+            headers = dict(rec.headers,
+                           Range="bytes={}-".format(start_bytes))
+            if start_bytes and saved_validator is not None:
+                headers["If-Range"] = saved_validator
+            vid = self._request(rec, "GET", vid_url, headers=headers,
+                                stream=True, timeout=self.args.timeout)
+            if vid.status_code != 416 or not start_bytes:
+                break
+            vid.close()
+            total_size = parse_content_range(
+                vid.headers.get("content-range"))[1]
+            if total_size is None:
+                total_size = int(self._head(rec, vid_url, clip, stream)
+                                 .get("content-length") or 0) or None
+            if total_size == start_bytes:
+                if digest is not None:
+                    hash_file(filepath_tmp, digest)
+                return 0
+            if total_size is None or total_size > start_bytes:
+                # nothing tells that the partial file is wrong, keep it
+                raise DownloadError("Range of {} bytes not satisfiable, "
+                                    "remote size {}".format(start_bytes,
+                                                            total_size),
+                                    416, retryable=True)
+            self._print("Incomplete file is larger than the remote one, "
+                        "restarting download", 2)
+            os.remove(filepath_tmp)
+        if vid.status_code not in [200, 206]:
+            vid.close()
+            raise DownloadError.from_response(vid)
+        total_size = response_total_size(vid)
+        if total_size <= 0:
+            vid.close()
+            raise DownloadError("Invalid file size: {}".format(total_size),
+                                retryable=False)
+        if vid.status_code == 200 and start_bytes:
+            self._print("Remote file changed since the download started, "
+                        "or can't be resumed, restarting download", 2)
+            start_bytes = 0
+        elif (vid.status_code == 206 and
+              parse_content_range(vid.headers.get("content-range"))[0]
+              != start_bytes):
+            vid.close()
+            raise DownloadError("Unexpected range: {}".format(
+                vid.headers.get("content-range")))
+        validator = get_validator(vid.headers)
+        if validator is not None and validator != saved_validator:
+            save_validator(filepath_tmp + ".validator", validator)
+        try:
+            check_free_space(filepath_tmp, total_size - start_bytes)
+        except DownloadError:
+            vid.close()
+            raise
+        if start_bytes > 0:
+            self._print("Incomplete file found ({:.2f}%), resuming..."
+                        .format(100*start_bytes/total_size), 1)
+        if digest is not None and start_bytes:
+            hash_file(filepath_tmp, digest, start_bytes)
+        with open(filepath_tmp, "ab" if start_bytes else "wb") as vid_file:
+            with self._progress_bar(filepath_tmp[:-len(".part")],
+                                    total_size, start_bytes) as pbar:
+                written = copy_stream(vid, vid_file, pbar.update,
+                                      fsync_every=(self.args.fsync_every *
+                                                   1024**2),
+                                      throttle=self._throttle(),
+                                      block_size=self._block_size,
+                                      digest=digest)
+        vid.close()
+        size = os.path.getsize(filepath_tmp)
+        if size != total_size:
+            raise DownloadError("Incomplete download ({} of {} bytes)"
+                                .format(size, total_size))
+        return written
+
+    def _progress_bar(self, filepath, total_size, initial=0):
+        """Return the progress bar of a download.
+
+        Bars are only drawn on a terminal and when not quiet, so tqdm is
+        only imported then. Otherwise, a stand-in doing nothing is returned.
+        """
+        if self.loglevel >= 5 or not sys.stderr.isatty():
+            return _NoProgressBar()
+        from tqdm import tqdm
+        return tqdm(total=total_size,
+                    desc=os.path.basename(filepath),
+                    unit='B',
+                    initial=initial,
+                    dynamic_ncols=True,
+                    unit_scale=True,
+                    unit_divisor=1024)
+
+    def _refresh_vid_url(self, rec: Recording, vid_name,
+                         vid_url) -> Optional[str]:
+        """Fetch the page again, to get a fresh signed url of a stream.
+
+        The streams of a clip share its Recording, so one refresh at a time
+        updates it, and the others get the url it found.
+        """
+        with rec.refresh_lock:
+            fresh_url = get_stream_urls(rec.metadata).get(vid_name)
+            if fresh_url is not None and fresh_url != vid_url:
+                # refreshed by another stream in the meantime
+                return fresh_url
+            self._print("Video url may have expired, fetching the page "
+                        "again", 2)
+            if rec.cache_key is not None:
+                self.cache.invalidate(rec.cache_key)
+                rec.cache_key = None
+            self._change_page(rec, rec.page_url)
+            metadata = self._parse_page(rec)
+            if metadata is None:
                 return None
+            rec.metadata = metadata
+            return get_stream_urls(metadata).get(vid_name)
+
+    def _head(self, rec: Recording, vid_url, clip: int = None,
+              stream: str = None) -> dict:
+        """Return the relevant headers of the video, from cache if possible.
+
+        Raises:
+            DownloadError: if the HEAD request fails
+        """
+        if self.cache is not None:
+            headers = self.cache.get_head(vid_url)
+            if headers is not None:
+                return headers
+        with self.stats.phase("head", rec.url, clip, stream=stream):
+            vid_header = self._request(rec, "HEAD", vid_url,
+                                       headers=rec.headers,
+                                       allow_redirects=False,
+                                       timeout=self.args.timeout)
+        if not vid_header.ok:
+            raise DownloadError.from_response(vid_header)
+        headers = {key: vid_header.headers.get(key)
+                   for key in ("content-length", "accept-ranges", "etag",
+                               "last-modified")}
+        if self.cache is not None:
+            self.cache.put_head(vid_url, headers)
+        return headers
+
+    def _download_segmented(self, rec: Recording, vid_url, filepath_tmp,
+                            total_size, validator: str = None) -> int:
+        """Download vid_url to filepath_tmp using parallel range requests.
+
+        The file is extended to total_size (its blocks reserved on disk
+        with --preallocate) and each connection writes its own byte range
+        at the right offset. Completed ranges are kept in a `.segments`
+        sidecar, checkpointed every CHECKPOINT_INTERVAL seconds, so that an
+        interrupted download can be resumed later, even if it was killed or
+        the system crashed.
+        When a range fails, what it already wrote is kept as a completed
+        range too.
+
+        Returns:
+            int: count of bytes downloaded
+
+        Raises:
+            DownloadError: if the download of a range failed
+        """
+        segments_path = filepath_tmp + ".segments"
+        state = load_segments(segments_path, total_size)
+        if state is None:
+            if os.path.exists(segments_path):
+                self._print("Incomplete file doesn't match the remote one, "
+                            "restarting download", 2)
+                os.remove(segments_path)
+                if os.path.exists(filepath_tmp):
+                    os.remove(filepath_tmp)
+            # a plain .part (single connection) is resumed where it stopped
+            start_bytes = int(os.path.exists(filepath_tmp) and
+                              os.path.getsize(filepath_tmp))
+            if start_bytes > total_size:
+                os.remove(filepath_tmp)
+                start_bytes = 0
+            segments = [(start + start_bytes, end + start_bytes)
+                        for start, end in split_ranges(
+                            total_size - start_bytes, self.args.connections)]
+            state = {"total_size": total_size,
+                     "segments": segments,
+                     "done": []}
+            preallocate(filepath_tmp, total_size,
+                        reserve=self.args.preallocate)
+            save_segments(segments_path, state)
+        todo = [seg for seg in state["segments"] if seg not in state["done"]]
+        initial = total_size - sum(end - start + 1 for start, end in todo)
+        if initial > 0:
+            self._print("Incomplete file found ({:.2f}%), resuming..."
+                        .format(100*initial/total_size), 1)
+        self._print("Downloading {} segments over {} connections".format(
+            len(todo), self.args.connections), 0)
+
+        lock = threading.Lock()
+        stop = threading.Event()
+        progress = {segment: 0 for segment in todo}
+        downloaded = 0
+        error = None
+        with self._progress_bar(filepath_tmp[:-len(".part")], total_size,
+                                initial) as pbar, \
+                ThreadPoolExecutor(self.args.connections) as pool:
+
+            def update(segment, size):
+                with lock:
+                    pbar.update(size)
+                    progress[segment] += size
+
+            futures = {pool.submit(self._download_segment, rec, vid_url,
+                                   filepath_tmp, segment, update, stop,
+                                   validator):
+                       segment
+                       for segment in todo}
+            pending = set(futures)
+            try:
+                while pending:
+                    done, pending = wait(pending, CHECKPOINT_INTERVAL,
+                                         FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            future.result()
+                        except NETWORK_ERRORS as exc:
+                            error = error or DownloadError(str(exc))
+                        except DownloadError as exc:
+                            error = error or exc
+                    with lock:
+                        for future in done:
+                            segment = futures[future]
+                            written = progress.pop(segment)
+                            downloaded += written
+                            self._segment_progress(state, segment, written)
+                        # ranges still downloading are saved as far as
+                        # they went, without changing the live state
+                        checkpoint = {"total_size": total_size,
+                                      "segments": list(state["segments"]),
+                                      "done": list(state["done"])}
+                        for segment, written in progress.items():
+                            self._segment_progress(checkpoint, segment,
+                                                   written)
+                    # counted bytes were flushed, see _download_segment,
+                    # and are synced before being checkpointed
+                    save_segments(segments_path, checkpoint, filepath_tmp)
+                    if error is not None:
+                        stop.set()
+            finally:
+                stop.set()
+                for future in futures:
+                    future.cancel()
+        if error is not None:
+            raise error
+        os.remove(segments_path)
+        return downloaded
+
+    @staticmethod
+    def _segment_progress(state, segment, written):
+        """Record in state that written bytes of segment were downloaded."""
+        start, end = segment
+        if written == 0:
+            return
+        if written < end - start + 1:
+            # split the segment, to only download the rest next time
+            idx = state["segments"].index(segment)
+            segment = (start, start + written - 1)
+            state["segments"][idx:idx+1] = [segment,
+                                            (start + written, end)]
+        state["done"].append(segment)
+
+    def _download_segment(self, rec: Recording, vid_url, filepath_tmp,
+                          segment, update, stop, validator: str = None):
+        """Download one byte range of vid_url in filepath_tmp.
+
+        Raises:
+            DownloadError: if the range request fails or is incomplete
+        """
+        start, end = segment
+        headers = dict(rec.headers, Range="bytes={}-{}".format(start, end))
+        if validator is not None:
+            headers["If-Range"] = validator
+        vid = self._request(rec, "GET", vid_url, headers=headers,
+                            stream=True, timeout=self.args.timeout)
+        if vid.status_code == 200 and validator is not None:
+            # the next try restarts the download, see _transfer, with
+            # fresh headers
+            vid.close()
+            if self.cache is not None:
+                self.cache.invalidate(vid_url)
+            raise DownloadError("Remote file changed during the download")
+        if vid.status_code != 206:
+            vid.close()
+            raise DownloadError.from_response(vid)
+
+        length = end - start + 1
+        with open(filepath_tmp, "r+b") as vid_file:
+
+            def on_block(size):
+                # only count bytes in the file, as they may be checkpointed
+                vid_file.flush()
+                update(segment, size)
+
+            vid_file.seek(start)
+            written = copy_stream(vid, vid_file, on_block,
+                                  length=length,
+                                  fsync_every=self.args.fsync_every * 1024**2,
+                                  stop=stop,
+                                  throttle=self._throttle(),
+                                  block_size=self._block_size)
+        vid.close()
+        if written != length and not stop.is_set():
+            raise DownloadError("Incomplete range {}-{} ({} of {} bytes)"
+                                .format(start, end, written, length))
+
+    def download(self, all_urls):
+        """Exposed class to download a list of urls.
+
+        Urls are processed concurrently by `args.jobs` workers.
+
+        Returns:
+            bool: True if every url was downloaded successfully
+        """
+        if self.metrics is not None:
+            self.metrics.queue_depth = len(all_urls)
+        try:
+            if len(all_urls) == 1:
+                return self._download_one(all_urls[0])
+            success = True
+            with ThreadPoolExecutor(self.args.jobs) as pool:
+                futures = {pool.submit(self._download_one, url): url
+                           for url in all_urls}
+                for future in as_completed(futures):
+                    if not future.result():
+                        self._print("Failed to download {}".format(
+                            futures[future]), 3)
+                        success = False
+            return success
+        finally:
+            self._close_stats()
+
+    def _close_stats(self):
+        """Print the totals of the stats, and close the stats file."""
+        for phase, total in self.stats.totals.items():
+            self._print("{}: {} in {:.3f}s, {} bytes".format(
+                phase, total["count"], total["duration"], total["bytes"]), 0)
+        self._print("{} HTTP requests over {} connections, {} reused"
+                    .format(self.connections.requests,
+                            self.connections.opened,
+                            self.connections.reused), 0)
+        if self._stats_file is not None:
+            self._stats_file.close()
+
+    def inventory(self, all_urls, path) -> bool:
+        """Write a JSON line describing each recording of all_urls to path.
+
+        No video is downloaded: the pages are fetched and parsed by
+        `args.jobs` workers, and the size of the videos comes from HEAD
+        requests. Each clip asked by `args.count_clips` gets its line, and a
+        url that can't be read gets a line with an "error" key.
+
+        Args:
+            path (str): path of the inventory, '-' for the standard output
+
+        Returns:
+            bool: True if every url could be described
+        """
+        success = True
+        out = (sys.stdout if path == "-" else
+               open(path, "w", encoding="utf-8"))
+        try:
+            with ThreadPoolExecutor(self.args.jobs) as pool:
+                futures = [pool.submit(self._describe_recording, url)
+                           for url in all_urls]
+                # lines are written by this thread only, as they come
+                for future in as_completed(futures):
+                    for entry in future.result():
+                        success = success and "error" not in entry
+                        out.write(json.dumps(entry) + "\n")
+                    out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+            self._close_stats()
+        return success
+
+    def _describe_recording(self, url) -> list:
+        """Return the inventory entries of the clips of url."""
+        try:
+            rec = self._open_recording(url)
+        except ZoomDLError as exc:
+            return [{"url": url, "error": str(exc)}]
+        total_clips = int(rec.metadata["totalClips"])
+        clip = int(rec.metadata["currentClip"])
+        count_clips = self.args.count_clips
+        if count_clips == 1:
+            # only this one, named as when downloaded
+            return [self._describe_clip(rec, None)]
+        last_clip = (total_clips if count_clips == 0 else
+                     min(count_clips, total_clips))
+        entries = [self._describe_clip(rec, clip)]
+        while clip < last_clip:
+            try:
+                rec = self._next_clip(rec)
+            except ZoomDLError as exc:
+                entries.append({"url": url, "clip": clip + 1,
+                                "error": str(exc)})
+                break
+            if rec is None:
+                break
+            clip += 1
+            entries.append(self._describe_clip(rec, clip))
+        return entries
+
+    def _describe_clip(self, rec: Recording, clip: Optional[int]) -> dict:
+        """Return the inventory entry of the current clip of rec."""
+        meta = rec.metadata
+        if self.meta_store is not None:
+            self.dump_page_meta(rec, None, clip)
+        streams = {}
+        for vid_name, vid_url in get_stream_urls(meta).items():
+            try:
+                size = self._head(rec, vid_url, clip,
+                                  vid_name).get("content-length")
+                streams[vid_name] = {"size": int(size) if size else None}
+            except NETWORK_ERRORS + (DownloadError,) as exc:
+                streams[vid_name] = {"size": None, "error": str(exc)}
+        return {"url": rec.url,
+                "clip": clip,
+                "page_url": rec.page_url,
+                "topic": meta.get("topic") or meta.get("r_meeting_topic"),
+                "fileStartTime": meta.get("fileStartTime"),
+                "totalClips": meta.get("totalClips"),
+                "currentClip": meta.get("currentClip"),
+                "streams": streams,
+                "chats": len(meta.get("chatList") or ()),
+                "transcripts": len(meta.get("transcriptList") or ())}
+
+    def serve(self, queue: DownloadQueue):
+        """Download the recordings of the queue, waiting for new ones.
+
+        Up to `args.jobs` recordings are downloaded at the same time, and
+        their leases renewed every POLL_INTERVAL seconds. Complete files are
+        skipped (see --manifest) and partial ones resumed, so a job taken
+        back after a crash goes on where it stopped. Never returns.
+        """
+        recovered = queue.recover()
+        if recovered:
+            self._print("Resuming {} interrupted recordings".format(
+                recovered), 1)
+        active = {}
+        with ThreadPoolExecutor(self.args.jobs) as pool:
+            while True:
+                while len(active) < self.args.jobs:
+                    job = queue.lease()
+                    if job is None:
+                        break
+                    self._print("Downloading {} (try {})".format(
+                        job.url, job.attempts), 1)
+                    active[pool.submit(self._download_job, job)] = job
+                if self.metrics is not None:
+                    self.metrics.queue_depth = queue.counts().get("queued", 0)
+                if not active:
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                done, _ = wait(active, POLL_INTERVAL, FIRST_COMPLETED)
+                for future in done:
+                    job = active.pop(future)
+                    error = future.result()
+                    if error is None:
+                        queue.complete(job)
+                    elif queue.fail(job, error):
+                        self._print("Failed to download {}, will retry"
+                                    .format(job.url), 2)
+                    else:
+                        self._print("Failed to download {}, giving up"
+                                    .format(job.url), 3)
+                queue.renew(list(active.values()))
 
-            # look for clips
-            total_clips = int(self.metadata["totalClips"])
-            current_clip = int(self.metadata["currentClip"])
-            count_clips = self.args.count_clips
-            filename = self.args.filename
-            if count_clips == 1:  # only download this
-                self.download_vid(filename)
-                if self.args.dump_pagemeta:
-                    self.dump_page_meta(filename)
-            else:  # download multiple
-                if count_clips == 0:
-                    to_download = total_clips  # download this and all nexts
-                else:  # download as many as asked (or possible)
-                    to_download = min(count_clips, total_clips)
-                for clip in range(current_clip, to_download+1):
-                    self.download_vid(filename, clip)
-                    if self.args.dump_pagemeta:
-                        self.dump_page_meta(filename, clip)
-                    url = self.page.url
-                    next_time = str(self.metadata["nextClipStartTime"])
-                    if next_time != "-1":
-                        if "&startTime" not in url:
-                            url += "&startTime={}".format(next_time)
-                        else:
-                            curr_time = re.findall(r"startTime=(\d+)", url)[0]
-                            url = url.replace(curr_time, next_time)
-                        self._change_page(url)
-                        self.metadata = self.get_page_meta()
+    def _download_job(self, job: Job) -> Optional[str]:
+        """Download the recording of a job with its options.
+
+        Returns:
+            str: the error, if the download failed
+        """
+        try:
+            zoomdl = self.with_options(manifest=True, **job.options)
+            zoomdl.overwrite = True
+            zoomdl.download_recording(job.url)
+        except ZoomDLError as exc:
+            # already reported
+            return str(exc) or type(exc).__name__
+        except SystemExit as exc:
+            if exc.code:
+                return "Exited with {}".format(exc.code)
+        except Exception as exc:
+            # a bad page or option must not stop the other jobs
+            error = "{}: {}".format(type(exc).__name__, exc)
+            self._print("Error downloading {}: {}".format(job.url, error), 3)
+            return error
+        return None
+
+    def _download_one(self, url) -> bool:
+        """Download one url, catching errors so the batch can go on."""
+        if self.metrics is not None:
+            self.metrics.dequeue()
+        try:
+            return self.download_recording(url)
+        except ZoomDLError:
+            # already reported
+            return False
+        except SystemExit as exc:
+            return not exc.code
+        except Exception as exc:
+            # a bad page or a full disk must not stop the other urls
+            self._print("Error downloading {}: {}: {}".format(
+                url, type(exc).__name__, exc), 3)
+            return False
+
+    def _open_recording(self, url) -> Recording:
+        """Load the page of url and its metadata, authenticating if needed.
+
+        Raises:
+            InvalidURLError: if the url is not a zoom url
+            AuthenticationError: if the password is refused
+            PageError: if the page can't be loaded
+            MetadataError: if the metadata can't be found in the page, or
+                is invalid
+        """
+        try:
+            rec = Recording(url, self.args.filename_add_date)
+        except IndexError:
+            self._print("Unable to extract domain and subdomain "
+                        "from url {}, exitting".format(url), 4)
+            raise InvalidURLError("Not a zoom url: {}".format(url))
+        self._load_page(rec, url,
+                        authenticate=self.args.password is not None)
+        if rec.metadata is None:
+            self._print("Unable to find metadata, aborting.", 4)
+            raise MetadataError("Unable to find metadata in {}".format(url))
+        try:
+            int(rec.metadata["totalClips"])
+            int(rec.metadata["currentClip"])
+            rec.recording_name
+        except (KeyError, TypeError, ValueError, MetadataError) as exc:
+            self._print("Invalid metadata, aborting.", 4)
+            raise MetadataError("Invalid metadata in {}: {!r}".format(
+                url, exc))
+        return rec
+
+    def fetch_metadata(self, url) -> dict:
+        """Return the metadata of the recording at url.
+
+        Raises:
+            ZoomDLError: see _open_recording
+        """
+        return self._open_recording(url).metadata
+
+    def download_recording(self, url) -> bool:
+        """Download the clips of one url.
+
+        Returns:
+            bool: True if the recording was downloaded
+
+        Raises:
+            ZoomDLError: if the recording or one of its files can't be
+            downloaded
+        """
+        rec = self._open_recording(url)
+
+        # look for clips
+        total_clips = int(rec.metadata["totalClips"])
+        current_clip = int(rec.metadata["currentClip"])
+        count_clips = self.args.count_clips
+        filename = self.args.filename
+        if filename == "-":
+            # videos go to stdout, other files get the name given by Zoom
+            filename = None
+        if count_clips == 1:  # only download this
+            self.download_vid(rec, filename)
+            if self.args.dump_pagemeta or self.meta_store is not None:
+                self.dump_page_meta(rec, filename)
+        else:  # download multiple
+            if count_clips == 0:
+                to_download = total_clips  # download this and all nexts
+            else:  # download as many as asked (or possible)
+                to_download = min(count_clips, total_clips)
+            self._download_clips(rec, filename, current_clip, to_download)
+        return True
+
+    def _download_clips(self, rec: Recording, filename, first_clip,
+                        last_clip):
+        """Download clips first_clip to last_clip (included), pipelined.
+
+        Each page gives the start time of the next clip, so pages are
+        resolved one after the other, but while the clips before are
+        downloading. Up to `args.clip_lookahead` more clips are downloaded
+        while the oldest one is not done.
+        """
+        lookahead = self.args.clip_lookahead
+        with ThreadPoolExecutor(lookahead + 1) as pool:
+            pending = deque()
+            for clip in range(first_clip, last_clip+1):
+                pending.append(pool.submit(self._download_clip, rec,
+                                           filename, clip))
+                if clip < last_clip:
+                    rec = self._next_clip(rec)
+                while len(pending) > lookahead or (rec is None and pending):
+                    pending.popleft().result()
+                if rec is None:
+                    break
+            for future in pending:
+                future.result()
+
+    def _download_clip(self, rec: Recording, filename, clip):
+        """Download one clip of a recording."""
+        self.download_vid(rec, filename, clip)
+        if self.args.dump_pagemeta or self.meta_store is not None:
+            self.dump_page_meta(rec, filename, clip)
+
+    def _next_clip(self, rec: Recording) -> Optional[Recording]:
+        """Load the page of the clip following rec.
+
+        Returns:
+            Recording: state of the next clip, or None if there is none
+        """
+        url = rec.page_url
+        next_time = str(rec.metadata["nextClipStartTime"])
+        if next_time == "-1":
+            return None
+        if "&startTime" not in url:
+            url += "&startTime={}".format(next_time)
+        else:
+            curr_time = re.findall(r"startTime=(\d+)", url)[0]
+            url = url.replace(curr_time, next_time)
+        next_rec = Recording(rec.url, rec.filename_add_date)
+        self._load_page(next_rec, url)
+        if next_rec.metadata is None:
+            self._print("Unable to find metadata of next clip, "
+                        "stopping.", 3)
+            return None
+        return next_rec
 
     # def check_captcha(self):
     #     """Check whether or not a page is protected by CAPTCHA.
@@ -388,12 +1565,12 @@ class ZoomDL():
     #         "Unable to download"))
     #         sys.exit(1)
 
-    def authenticate(self):
+    def authenticate(self, rec: Recording):
         # that shit has a password
         # first look for the meet_id
         self._print("Using password '{}'".format(self.args.password))
         meet_id_regex = re.compile("<input[^>]*")
-        input_tags = meet_id_regex.findall(self.page.text)
+        input_tags = meet_id_regex.findall(rec.page.text)
         meet_id = None
         for inp in input_tags:
             input_split = inp.split()
@@ -409,15 +1586,77 @@ class ZoomDL():
                             "to http://github.com/battleman/zoomdl",
                             4)
             self._print("\n".join(input_tags), 0)
-            sys.exit(1)
+            raise AuthenticationError("Unable to find meetId in the page")
 
         # create POST request
         data = {"id": meet_id, "passwd": self.args.password,
                 "action": "viewdetailpage"}
         check_url = ("https://{}{}/rec/validate_meet_passwd"
-                     .format(self.subdomain, self.domain))
-        self.session.post(check_url, data=data)
-        self._change_page(self.url)  # get as if nothing
+                     .format(rec.subdomain, rec.domain))
+        self._wait_page_slot()
+        with self.stats.phase("authenticate", rec.url):
+            response = self._request(rec, "POST", check_url, data=data,
+                                     headers=rec.headers)
+        try:
+            status = response.json()
+        except ValueError:
+            status = None
+        if isinstance(status, dict) and status.get("status") is False:
+            self._print("[CRITICAL]Wrong password", 4)
+            raise AuthenticationError("Password refused for {}"
+                                      .format(rec.url))
+        if response.ok and DATA_REGEX.search(response.text):
+            # redirected to the recording page itself, no need to get it
+            self._print("Using the page the password was posted to", 0)
+            rec.page = response
+            rec.page_url = response.url
+            return
+        self._change_page(rec, rec.url)  # get as if nothing
+
+
+class _NoProgressBar():
+    """Stand-in of a tqdm progress bar, when none is drawn."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def update(self, size):
+        pass
+
+
+def decode_js_object(text: str):
+    """Decode a JS object literal found in a page.
+
+    Try first the (fast) standard json decoder, and fall back on the
+    (slow but lenient) demjson3 decoder, imported only then.
+
+    Raises:
+        ValueError: if the object can't be decoded
+    """
+    try:
+        return json.loads(js_to_json(text))
+    except ValueError:
+        pass
+    import demjson3
+    try:
+        return demjson3.decode(text)
+    except demjson3.JSONDecodeError as exc:
+        raise ValueError(str(exc)) from exc
+
+
+def get_stream_urls(metadata: dict) -> dict:
+    """Return the urls of the video streams found in metadata, by name."""
+    all_urls = {
+        "camera": metadata.get("viewMp4Url"),
+        "screen": metadata.get("shareMp4Url"),
+        # the link below is rarely valid
+        # (only when both the two links above are invalid)
+        "unknown": metadata.get("url"),
+    }
+    return {name: url for name, url in all_urls.items() if url}
 
 
 def confirm(message):
@@ -429,74 +1668,61 @@ def confirm(message):
 
     `return` {bool} True if the answer is Y.
     """
-    answer = None
-    while answer not in ["y", "n", ""]:
-        answer = input(message + " Continue? [y/N]: ").lower()  # nosec
+    # workers may ask at the same time, one question at a time
+    with _CONFIRM_LOCK:
+        answer = None
+        while answer not in ["y", "n", ""]:
+            answer = input(message + " Continue? [y/N]: ").lower()  # nosec
     return answer == "y"
 
 
-def get_filepath(user_fname: str,
-                 file_fname: str,
-                 extension: str,
-                 clip: int = None,
-                 appendix: str = "") -> str:
-    """Create an filepath."""
+def make_filepath(user_fname: str,
+                  file_fname: str,
+                  extension: str,
+                  clip: int = None,
+                  appendix: str = "",
+                  directory: str = None) -> str:
+    """Create an filepath, without checking for an existing file.
+
+    Relative paths are relative to directory, by default the current one.
+    """
     if user_fname is None:
-        basedir = os.getcwd()
+        basedir = directory or os.getcwd()
         # remove illegal characters
         name = os.path.join(basedir, re.sub(
             r"[/\\\?*:\"|><]+", "_", file_fname))
 
     else:
-        name = os.path.abspath(user_fname)
+        name = os.path.abspath(os.path.join(directory or "", user_fname))
     if clip is not None:
         name += "_clip{}".format(clip)
     name += appendix
-    filepath = "{}.{}".format(name, extension)
+    return "{}.{}".format(name, extension)
+
+
+def get_filepath(user_fname: str,
+                 file_fname: str,
+                 extension: str,
+                 clip: int = None,
+                 appendix: str = "",
+                 directory: str = None,
+                 overwrite: Optional[bool] = None) -> str:
+    """Create an filepath.
+
+    If the file already exists, it is erased if overwrite is True, and an
+    OutputExistsError is raised if it is False. By default, the user is
+    asked. Its directory is created if needed.
+    """
+    filepath = make_filepath(user_fname, file_fname, extension, clip,
+                             appendix, directory)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
     # check file doesn't already exist
     if os.path.isfile(filepath):
-        if not confirm("File {} already exists. This will erase it"
-                       .format(filepath)):
+        if overwrite is False:
+            raise OutputExistsError("File {} already exists"
+                                    .format(filepath))
+        if not overwrite and not confirm(
+                "File {} already exists. This will erase it".format(filepath)):
             sys.exit(0)
         os.remove(filepath)
     return filepath
-
-
-def shift_time_delta(time_str: str,
-                     delta_second: int = 0,
-                     with_ms: bool = False):
-    """Shift given time by adding `delta_second` seconds then format it.
-
-    `delta_seconds` can be negative.
-    """
-    tmp_timedelta = parse_timedelta(time_str)
-    total_seconds = int(tmp_timedelta.total_seconds()) + delta_second
-    hours, rem = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(rem, 60)
-    output = f'{hours:02d}:{minutes:02d}:{seconds:02d}'
-    if with_ms:
-        output += f'.{tmp_timedelta.microseconds:03d}'
-    return output
-
-
-def parse_timedelta(value):
-    """
-    Convert input string to timedelta.
-
-    Supported strings are like `01:23:45.678`.
-    """
-    value = re.sub(r"[^0-9:.]", "", value)
-    if not value:
-        return
-    if "." in value:
-        ms = int(value.split(".")[1])
-        value = value.split(".")[0]
-    else:
-        ms = 0
-    delta = datetime.timedelta(**{
-        key: float(val)
-        for val, key in zip(value.split(":")[::-1],
-                            ("seconds", "minutes", "hours", "days"))
-    })
-    delta += datetime.timedelta(microseconds=ms)
-    return delta